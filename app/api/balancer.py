@@ -0,0 +1,129 @@
+import time
+import random
+
+
+class Unavailable(Exception):
+    pass
+
+
+class Endpoint:
+
+    def __init__(
+            self,
+            url: str,
+    ):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.failures = 0
+        self.requests = 0
+        self.errors = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    def state(
+            self,
+            now: float,
+            open_seconds: float,
+    ) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if now - self.opened_at >= open_seconds:
+            return "half-open"
+        return "open"
+
+
+class Balancer:
+
+    def __init__(
+            self,
+            urls: list[str],
+            failure_threshold: int = 3,
+            open_seconds: float = 30,
+    ):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+    def acquire(
+            self,
+            exclude: set[str] = frozenset(),
+    ) -> Endpoint:
+        # Least outstanding requests among endpoints whose circuit is
+        # closed; a half-open endpoint gets a single trial request
+        now = time.monotonic()
+        closed = []
+        half_open = []
+        for endpoint in self.endpoints:
+            if endpoint.url in exclude:
+                continue
+            match endpoint.state(now, self.open_seconds):
+                case "closed":
+                    closed.append(endpoint)
+                case "half-open" if not endpoint.probing:
+                    half_open.append(endpoint)
+        if closed:
+            fewest = min(endpoint.outstanding for endpoint in closed)
+            endpoint = random.choice(
+                [endpoint for endpoint in closed if endpoint.outstanding == fewest]
+            )
+        elif half_open:
+            endpoint = random.choice(half_open)
+            endpoint.probing = True
+        else:
+            raise Unavailable("No Tika server is available")
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        return endpoint
+
+    def release(
+            self,
+            endpoint: Endpoint,
+            ok: bool | None,
+    ):
+        # None is an outcome that says nothing about the server's health
+        endpoint.outstanding -= 1
+        endpoint.probing = False
+        if ok:
+            self.mark_up(endpoint)
+        elif ok is not None:
+            endpoint.errors += 1
+            self.mark_failure(endpoint)
+
+    def mark_up(
+            self,
+            endpoint: Endpoint,
+    ):
+        endpoint.failures = 0
+        endpoint.opened_at = None
+
+    def mark_failure(
+            self,
+            endpoint: Endpoint,
+    ):
+        endpoint.failures += 1
+        # A failed trial reopens the circuit right away
+        if endpoint.opened_at is not None or endpoint.failures >= self.failure_threshold:
+            endpoint.opened_at = time.monotonic()
+
+    def mark_down(
+            self,
+            endpoint: Endpoint,
+    ):
+        endpoint.failures = max(endpoint.failures, self.failure_threshold)
+        endpoint.opened_at = time.monotonic()
+
+    def stats(
+            self,
+    ) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "url": endpoint.url,
+                "state": endpoint.state(now, self.open_seconds),
+                "outstanding": endpoint.outstanding,
+                "requests": endpoint.requests,
+                "errors": endpoint.errors,
+                "consecutive_failures": endpoint.failures,
+            }
+            for endpoint in self.endpoints
+        ]
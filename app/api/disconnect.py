@@ -0,0 +1,79 @@
+import asyncio
+from ..core.cancel import Cancellation, current_cancellation
+
+
+class CancelOnDisconnect:
+    # Plain ASGI middleware, so it sees the raw receive channel: once the
+    # request body is read, the next message can only be the client going
+    # away. When that happens before the response is complete the request's
+    # Cancellation is set, which stops its extraction in the threadpool and
+    # the pool workers, and the handler itself is cancelled
+
+    def __init__(
+            self,
+            app,
+    ):
+        self.app = app
+
+    async def __call__(
+            self,
+            scope,
+            receive,
+            send,
+    ):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cancellation = Cancellation()
+        completed = False
+        watcher = None
+
+        def disconnected():
+            if not completed:
+                cancellation.cancel()
+                handler.cancel()
+
+        async def watch():
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected()
+            return message
+
+        async def wrapped_receive():
+            nonlocal watcher
+            if watcher is not None:
+                # Everyone after the body gets the same disconnect message
+                return await asyncio.shield(watcher)
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected()
+            elif not message.get("more_body", False):
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        async def wrapped_send(message):
+            nonlocal completed
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                completed = True
+            await send(message)
+
+        token = current_cancellation.set(cancellation)
+        try:
+            handler = asyncio.ensure_future(
+                self.app(scope, wrapped_receive, wrapped_send)
+            )
+        finally:
+            current_cancellation.reset(token)
+        try:
+            await handler
+        except asyncio.CancelledError:
+            # Swallowed only when it is the client that went away; there is
+            # nobody left to send a response to
+            if asyncio.current_task().cancelling() or not cancellation.cancelled:
+                raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            if not handler.done():
+                handler.cancel()
@@ -0,0 +1,77 @@
+import os
+import httpx
+
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 30))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 200))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 50))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+
+_client: httpx.AsyncClient | None = None
+_counters = {
+    "requests": 0,
+    "connections_opened": 0,
+}
+
+
+async def _trace(
+        event_name: str,
+        info: dict,
+):
+    if event_name == "connection.connect_tcp.complete":
+        _counters["connections_opened"] += 1
+
+
+async def _on_request(
+        request: httpx.Request,
+):
+    _counters["requests"] += 1
+    request.extensions["trace"] = _trace
+
+
+def get_client() -> httpx.AsyncClient:
+    # One client per worker process: URL downloads, Tika calls and the
+    # health checks share its keep-alive (and HTTP/2) connections
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            event_hooks={
+                "request": [_on_request],
+            },
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def client_stats() -> dict:
+    connections = []
+    if _client is not None:
+        # httpx keeps the pool private; fall back to nothing if that changes
+        pool = getattr(_client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+    requests = _counters["requests"]
+    opened = _counters["connections_opened"]
+    return {
+        **_counters,
+        "reused_ratio": 1 - opened / requests if requests else None,
+        "open_connections": len(connections),
+        "idle_connections": sum(conn.is_idle() for conn in connections),
+        "http2_connections": sum("HTTP/2" in conn.info() for conn in connections),
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": HTTP_MAX_KEEPALIVE,
+        "http2": HTTP2_ENABLED,
+    }
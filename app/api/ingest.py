@@ -0,0 +1,561 @@
+import os
+import httpx
+import base64
+import asyncio
+import zipfile
+import hashlib
+import tempfile
+from typing import AsyncIterator
+from concurrent.futures import Future
+from fastapi import Request, UploadFile, HTTPException
+from .http_client import get_client
+from fastapi.concurrency import run_in_threadpool
+from ..core.buffer import PdfBuffer, PdfFile, shm_fits
+
+
+MAX_DOCUMENT_BYTES = int(os.getenv("MAX_DOCUMENT_BYTES", 256 * 1024 * 1024))
+INGEST_CHUNK_BYTES = int(os.getenv("INGEST_CHUNK_BYTES", 1024 * 1024))
+INGEST_DIR = os.getenv("INGEST_DIR", "/tmp/pdf-extractor-ingest")
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", 1000))
+BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", 16))
+# Total size of the documents one batch may bring in
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", 1024 * 1024 * 1024))
+# Ingested documents waiting for the extraction to take them
+BATCH_QUEUE_DOCUMENTS = int(os.getenv("BATCH_QUEUE_DOCUMENTS", 8))
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Document exceeds the limit of {MAX_DOCUMENT_BYTES} bytes",
+    )
+
+
+def _too_many() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"A batch takes at most {BATCH_MAX_DOCUMENTS} documents",
+    )
+
+
+def _batch_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Batch exceeds the limit of {BATCH_MAX_BYTES} bytes",
+    )
+
+
+def _invalid_pdf() -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail="Invalid PDF file",
+    )
+
+
+class BatchBudget:
+    # The bytes a whole batch may still bring in, drawn on by every one of
+    # its documents as their chunks arrive
+
+    def __init__(
+            self,
+            limit: int = BATCH_MAX_BYTES,
+    ):
+        self.remaining = limit
+
+    def check(
+            self,
+            size: int,
+    ):
+        if size > self.remaining:
+            raise _batch_too_large()
+
+    def take(
+            self,
+            size: int,
+    ):
+        self.check(size)
+        self.remaining -= size
+
+
+class Ingest:
+
+    def __init__(
+            self,
+            expected_size: int | None,
+            pdf_only: bool = True,
+            spool: bool = False,
+            budget: BatchBudget | None = None,
+    ):
+        # Bytes go straight into their final home chunk by chunk: a shared
+        # memory segment when the size is known up front and /dev/shm has
+        # room for it, otherwise (or when the consumer wants a file) a temp
+        # file on disk
+        if expected_size is not None and expected_size > MAX_DOCUMENT_BYTES:
+            raise _too_large()
+        if budget is not None and expected_size is not None:
+            budget.check(expected_size)
+        self.budget = budget
+        self.expected_size = expected_size
+        self.pdf_only = pdf_only
+        self.size = 0
+        self._head = b""
+        self._hash = hashlib.sha256()
+        self._file = None
+        self.document = None
+        if expected_size is not None and not spool and shm_fits(expected_size):
+            try:
+                self.document = PdfBuffer(size=expected_size)
+            except OSError:
+                # Shared memory filled up since the check
+                pass
+        if self.document is None:
+            os.makedirs(INGEST_DIR, exist_ok=True)
+            fd, path = tempfile.mkstemp(dir=INGEST_DIR, suffix=".pdf")
+            self._file = os.fdopen(fd, "wb")
+            self.document = PdfFile(path)
+
+    def write(
+            self,
+            chunk: bytes | memoryview,
+    ):
+        if self.size + len(chunk) > MAX_DOCUMENT_BYTES:
+            raise _too_large()
+        if self.budget is not None:
+            self.budget.take(len(chunk))
+        if self.pdf_only and len(self._head) < 4:
+            self._head += chunk[:4 - len(self._head)]
+            if not b"%PDF".startswith(self._head):
+                raise _invalid_pdf()
+        if self._file is not None:
+            self._file.write(chunk)
+        elif self.size + len(chunk) > self.expected_size:
+            raise HTTPException(
+                status_code=400,
+                detail="Document is longer than its declared Content-Length",
+            )
+        else:
+            self.document.write(self.size, chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def finish(
+            self,
+    ) -> PdfBuffer | PdfFile:
+        if self.pdf_only and self._head != b"%PDF":
+            raise _invalid_pdf()
+        if self._file is not None:
+            self._file.close()
+        self.document.size = self.size
+        self.document.digest = self._hash.hexdigest()
+        return self.document
+
+    def __enter__(
+            self,
+    ):
+        return self
+
+    def __exit__(
+            self,
+            exc_type,
+            *exc_info,
+    ):
+        # Anything but a finished document is thrown away
+        if exc_type is not None:
+            if self._file is not None:
+                self._file.close()
+            self.document.close()
+
+
+async def ingest_upload(
+        file: UploadFile,
+        pdf_only: bool = True,
+        spool: bool = False,
+        budget: BatchBudget | None = None,
+) -> PdfBuffer | PdfFile:
+    with Ingest(file.size, pdf_only, spool, budget) as ingest:
+        while chunk := await file.read(INGEST_CHUNK_BYTES):
+            ingest.write(chunk)
+        return ingest.finish()
+
+
+async def ingest_url(
+        url: str,
+        pdf_only: bool = True,
+        spool: bool = False,
+        budget: BatchBudget | None = None,
+) -> PdfBuffer | PdfFile:
+    try:
+        async with get_client().stream("GET", url) as response:
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=response.status_code,
+                    detail=f"Could not fetch file from URL: {response.reason_phrase}",
+                )
+            # A compressed body decodes to more than its Content-Length
+            expected_size = None
+            if "Content-Encoding" not in response.headers:
+                length = response.headers.get("Content-Length")
+                expected_size = int(length) if length else None
+            with Ingest(expected_size, pdf_only, spool, budget) as ingest:
+                async for chunk in response.aiter_bytes(INGEST_CHUNK_BYTES):
+                    ingest.write(chunk)
+                return ingest.finish()
+    except HTTPException:
+        raise
+    except httpx.RequestError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Request error: {e}",
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Unexpected error: {e}",
+        )
+
+
+async def ingest_request(
+        request: Request,
+        pdf_only: bool = True,
+        spool: bool = False,
+) -> PdfBuffer | PdfFile:
+    # A raw application/pdf body; the ASGI server hands it over in pieces
+    length = request.headers.get("Content-Length")
+    expected_size = int(length) if length else None
+    with Ingest(expected_size, pdf_only, spool) as ingest:
+        async for chunk in request.stream():
+            if chunk:
+                ingest.write(chunk)
+        return ingest.finish()
+
+
+class Base64Decoder:
+
+    def __init__(
+            self,
+    ):
+        self._pending = ""
+
+    def decode(
+            self,
+            text: str,
+    ) -> bytes:
+        # Only whole 4-character groups are decoded; the tail waits for the
+        # next piece so the split points do not matter
+        text = self._pending + "".join(text.split())
+        end = len(text) - len(text) % 4
+        self._pending = text[end:]
+        return base64.b64decode(text[:end])
+
+    def flush(
+            self,
+    ) -> bytes:
+        # Leftover characters are an unpadded tail, which b64decode rejects
+        return base64.b64decode(self._pending) if self._pending else b""
+
+
+async def ingest_base64(
+        data: str,
+        pdf_only: bool = True,
+        spool: bool = False,
+) -> PdfBuffer | PdfFile:
+    # The payload is decoded piece by piece straight into the document, so
+    # the decoded bytes never exist as one more full copy next to the str;
+    # its decoded length is only known at the end, hence the upper bound
+    with Ingest(len(data) // 4 * 3, pdf_only, spool) as ingest:
+        # Decoding and hashing hundreds of MB would stall the event loop
+        await run_in_threadpool(_decode_into, ingest, data)
+        return ingest.finish()
+
+
+def _decode_into(
+        ingest: Ingest,
+        data: str,
+):
+    decoder = Base64Decoder()
+    step = INGEST_CHUNK_BYTES // 3 * 4
+    try:
+        for start in range(0, len(data), step):
+            ingest.write(decoder.decode(data[start:start + step]))
+        ingest.write(decoder.flush())
+    except ValueError:
+        raise _invalid_pdf()
+
+
+# A batch arrives as (index, name, document) items in the order its
+# documents are ready; a document that could not be ingested is its
+# HTTPException instead, so it fails alone
+
+
+def _close_document(
+        document: PdfBuffer | PdfFile | HTTPException,
+):
+    if not isinstance(document, HTTPException):
+        document.close()
+
+
+def ingest_uploads(
+        files: list[UploadFile],
+) -> AsyncIterator[tuple[int, str, PdfBuffer | PdfFile | HTTPException]]:
+    if len(files) > BATCH_MAX_DOCUMENTS:
+        raise _too_many()
+    # Multipart parts are spooled by now, so their sizes are known
+    if sum(file.size or 0 for file in files) > BATCH_MAX_BYTES:
+        raise _batch_too_large()
+    return _iter_uploads(files)
+
+
+async def _iter_uploads(
+        files: list[UploadFile],
+):
+    budget = BatchBudget()
+    for index, file in enumerate(files):
+        if file.content_type != "application/pdf":
+            document = HTTPException(
+                status_code=400,
+                detail="Invalid file type. Only PDF file allowed."
+            )
+        else:
+            try:
+                document = await ingest_upload(file, budget=budget)
+            except HTTPException as e:
+                document = e
+        yield index, file.filename, document
+
+
+def ingest_urls(
+        urls: list[str],
+) -> AsyncIterator[tuple[int, str, PdfBuffer | PdfFile | HTTPException]]:
+    if len(urls) > BATCH_MAX_DOCUMENTS:
+        raise _too_many()
+    return _iter_urls(urls)
+
+
+async def _fetch(
+        url: str,
+        budget: BatchBudget,
+) -> PdfBuffer | PdfFile | HTTPException:
+    try:
+        return await ingest_url(url, budget=budget)
+    except HTTPException as e:
+        return e
+
+
+async def _iter_urls(
+        urls: list[str],
+):
+    # At most BATCH_FETCH_CONCURRENCY downloads at a time, and a finished
+    # one holds its place until it has been taken, so downloads wait for
+    # the extraction instead of piling up
+    budget = BatchBudget()
+    queued = iter(enumerate(urls))
+    running = {}
+    try:
+        while True:
+            while len(running) < BATCH_FETCH_CONCURRENCY:
+                item = next(queued, None)
+                if item is None:
+                    break
+                index, url = item
+                running[asyncio.ensure_future(_fetch(url, budget))] = (index, url)
+            if not running:
+                return
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, url = running.pop(task)
+                yield index, url, task.result()
+    finally:
+        for task in running:
+            if task.done():
+                _close_document(task.result())
+            else:
+                # Ingest throws away a document cancelled half way
+                task.cancel()
+
+
+def _read_member(
+        archive: zipfile.ZipFile,
+        info: zipfile.ZipInfo,
+        budget: BatchBudget,
+        holder: list,
+):
+    # file_size is only what the archive claims; Ingest still counts the
+    # bytes that actually come out
+    try:
+        with Ingest(info.file_size, budget=budget) as ingest, archive.open(info) as file:
+            while chunk := file.read(INGEST_CHUNK_BYTES):
+                ingest.write(chunk)
+            document = ingest.finish()
+    except HTTPException as e:
+        document = e
+    except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+        document = HTTPException(
+            status_code=400,
+            detail=f"Could not read archive member: {e}",
+        )
+    holder.append(document)
+
+
+def _open_archive(
+        path: str,
+) -> tuple[zipfile.ZipFile, list[zipfile.ZipInfo]]:
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid zip archive",
+        )
+    members = [
+        info for info in archive.infolist()
+        if not info.is_dir() and info.filename.lower().endswith(".pdf")
+    ]
+    try:
+        if len(members) > BATCH_MAX_DOCUMENTS:
+            raise _too_many()
+        if sum(info.file_size for info in members) > BATCH_MAX_BYTES:
+            raise _batch_too_large()
+    except HTTPException:
+        archive.close()
+        raise
+    return archive, members
+
+
+async def ingest_archive(
+        file: UploadFile,
+) -> AsyncIterator[tuple[int, str, PdfBuffer | PdfFile | HTTPException]]:
+    # The archive is spooled to disk, then every PDF in it is unpacked
+    # straight into its own document as the batch gets to it
+    spooled = await ingest_upload(file, pdf_only=False, spool=True)
+    try:
+        archive, members = await run_in_threadpool(_open_archive, spooled.path)
+    except BaseException:
+        spooled.close()
+        raise
+    return _iter_archive(spooled, archive, members)
+
+
+async def _iter_archive(
+        spooled: PdfFile,
+        archive: zipfile.ZipFile,
+        members: list[zipfile.ZipInfo],
+):
+    budget = BatchBudget()
+    # A member the thread finished after this generator was cancelled is
+    # still found and closed here
+    holder = []
+    try:
+        for index, info in enumerate(members):
+            await run_in_threadpool(_read_member, archive, info, budget, holder)
+            yield index, info.filename, holder.pop()
+    finally:
+        for document in holder:
+            _close_document(document)
+        archive.close()
+        spooled.close()
+
+
+class BatchFeed:
+    # Hands a batch's documents from the event loop, where they are
+    # ingested, to the thread extracting them. At most
+    # BATCH_QUEUE_DOCUMENTS wait in between, so ingestion pauses while the
+    # extraction is behind, and pages start as soon as a document is in
+
+    def __init__(
+            self,
+            items: AsyncIterator[tuple[int, str, PdfBuffer | PdfFile | HTTPException]],
+    ):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=BATCH_QUEUE_DOCUMENTS)
+        self._fill_task = self._loop.create_task(self._fill(items))
+        self.names: dict[int, str] = {}
+        # Handed to the extraction and not closed yet
+        self._taken: dict[int, PdfBuffer | PdfFile] = {}
+
+    async def _fill(
+            self,
+            items,
+    ):
+        try:
+            async for item in items:
+                await self._queue.put(item)
+        finally:
+            await items.aclose()
+
+    async def _get(
+            self,
+    ) -> tuple | None:
+        while self._queue.empty():
+            if self._fill_task.done():
+                # Everything is through; an ingestion bug surfaces here
+                self._fill_task.result()
+                return None
+            getter = asyncio.ensure_future(self._queue.get())
+            try:
+                await asyncio.wait(
+                    [getter, self._fill_task],
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            except asyncio.CancelledError:
+                if getter.done() and not getter.cancelled():
+                    _close_document(getter.result()[2])
+                raise
+            finally:
+                getter.cancel()
+            if getter.done() and not getter.cancelled():
+                return getter.result()
+        return self._queue.get_nowait()
+
+    async def _next(
+            self,
+    ) -> tuple[int, PdfBuffer | PdfFile | str] | None:
+        item = await self._get()
+        if item is None:
+            return None
+        index, name, document = item
+        self.names[index] = name
+        if isinstance(document, HTTPException):
+            return index, document.detail
+        self._taken[index] = document
+        return index, document
+
+    def next(
+            self,
+    ) -> Future:
+        # Called from the extraction thread; a Future of the next
+        # (index, document), a str in place of a document that failed, or
+        # of None after the last one
+        return asyncio.run_coroutine_threadsafe(self._next(), self._loop)
+
+    @property
+    def count(
+            self,
+    ) -> int:
+        return len(self.names)
+
+    def done(
+            self,
+            index: int,
+    ):
+        document = self._taken.pop(index, None)
+        if document is not None:
+            document.close()
+
+    async def _close(
+            self,
+    ):
+        self._fill_task.cancel()
+        try:
+            await self._fill_task
+        except BaseException:
+            pass
+        while not self._queue.empty():
+            _close_document(self._queue.get_nowait()[2])
+        for index in list(self._taken):
+            self.done(index)
+
+    def close(
+            self,
+    ):
+        # Safe from any thread, the event loop's own included
+        self._loop.call_soon_threadsafe(self._loop.create_task, self._close())
@@ -1,20 +1,47 @@
 import os
+import json
+import asyncio
+import time
+import logging
+import threading
 import fitz
-import httpx
 import PyPDF2
 import base64
-import tempfile
-from tika import parser
+from enum import Enum
+from anyio import to_thread
+from functools import partial
+from typing import Iterator
+from contextlib import ExitStack, asynccontextmanager
 from ..core.extractor import (
     MuExtractor,
     OCRExtractor,
     PyPDFExtractor,
 )
 from fastapi import File, Form
+from .ingest import (
+    BatchFeed,
+    ingest_url,
+    ingest_urls,
+    ingest_base64,
+    ingest_upload,
+    ingest_archive,
+    ingest_request,
+    ingest_uploads,
+)
+from .tika_client import (
+    TIKA_URL,
+    tika_servers,
+    parse_document,
+    monitor_servers,
+)
+from .disconnect import CancelOnDisconnect
+from .http_client import get_client, close_client, client_stats
 from .schemas import (
+    JobKind,
     OCROption,
     LanguageOCR,
     JsonRequestTextUrl,
+    JsonRequestTextBatchUrl,
     JsonRequestImageUrl,
     JsonRequestTikaUrl,
     JsonRequestOcrUrl,
@@ -23,14 +50,536 @@ from .schemas import (
     JsonRequestTikaBase64,
     JsonRequestOcrBase64,
 )
-from ..core.utils import digits_to_latin
-from fastapi.responses import JSONResponse
+from ..core.utils import digits_to_latin, parse_page_ranges
+from ..core.buffer import PdfBuffer, PdfFile
+from ..core.cache import result_cache
+from ..core.admission import Overloaded, admission
+from ..core.jobs import job_queue
+from ..core.batch import iter_batch_text
+from ..core.flight import single_flight
+from ..core.cancel import Cancelled, current_cancellation
+from ..core.store import StoredPdf, document_store
+from starlette.background import BackgroundTask
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pytesseract import get_tesseract_version
-from fastapi import FastAPI, UploadFile, HTTPException
+from ..core.pool import pool_stats as get_pool_stats, start_pool, shutdown_pool
+from fastapi import FastAPI, Request, UploadFile, HTTPException
+
+
+API_THREADS = int(os.getenv("API_THREADS", 64))
+
+
+@asynccontextmanager
+async def lifespan(
+        app: FastAPI,
+):
+    # Extraction runs in the threadpool while the loop keeps serving, so
+    # the default of 40 threads would cap concurrent requests per worker
+    to_thread.current_default_thread_limiter().total_tokens = API_THREADS
+    start_pool()
+    get_client()
+    monitor = asyncio.create_task(monitor_servers())
+    yield
+    monitor.cancel()
+    await close_client()
+    shutdown_pool()
+
+
+app = FastAPI(title="Document Extractor", lifespan=lifespan)
+app.add_middleware(CancelOnDisconnect)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(
+        request: Request,
+        exc: Overloaded,
+):
+    return JSONResponse(
+        status_code=503,
+        content={
+            "detail": str(exc),
+        },
+        headers={
+            "Retry-After": str(exc.retry_after),
+        },
+    )
+
+
+@app.exception_handler(Cancelled)
+async def cancelled_handler(
+        request: Request,
+        exc: Cancelled,
+):
+    # The client is normally gone by now; this is for the access log
+    return JSONResponse(
+        status_code=499,
+        content={
+            "detail": str(exc),
+        },
+    )
+
+
+def _select_pages(
+        pages: str | None,
+        page_count: int,
+) -> list[int] | None:
+    if not pages:
+        return None
+    try:
+        return parse_page_ranges(pages, page_count)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "invalid pages entry": pages,
+                "error": str(e),
+            },
+        )
+
+
+def _stored(
+        document_id: str,
+) -> StoredPdf:
+    document = document_store.open(document_id)
+    if document is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Unknown or expired document",
+        )
+    return document
+
+
+def _job_page_count(
+        document_id: str,
+        pages: str | None,
+) -> int:
+    # Checked up front so a bad page selection fails the request, not the job
+    with _stored(document_id) as document:
+        try:
+            with fitz.open(document.path) as doc:
+                page_count = doc.page_count
+        except Exception:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid PDF file",
+            )
+    selected = _select_pages(pages, page_count)
+    return page_count if selected is None else len(selected)
+
+
+def _job(
+        job_id: str,
+) -> dict:
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Unknown or expired job",
+        )
+    return job
+
+
+async def _coalesce(
+        identity: str,
+        route: str,
+        options: dict,
+        stream: bool,
+        respond,
+        document: PdfBuffer | PdfFile | None = None,
+) -> Response:
+    # Identical requests arriving together (the same URL, or a document
+    # with the same digest, and the same options) share one extraction.
+    # Streamed responses are produced per client and are not shared
+    if stream:
+        return await respond()
+    key = result_cache.make_key(
+        identity,
+        route=route,
+        **{
+            name: value.value if isinstance(value, Enum) else value
+            for name, value in options.items()
+        },
+    )
+
+    started = False
+
+    async def body() -> bytes:
+        nonlocal started
+        started = True
+        response = await respond()
+        return response.body
+
+    try:
+        content = await single_flight.run(key, body)
+    finally:
+        # A request that joined another one never handed its copy over
+        if document is not None and not started:
+            document.close()
+    return Response(
+        content=content,
+        media_type="application/json",
+    )
+
+
+logger = logging.getLogger(__name__)
+
+
+def _ndjson(
+        item: dict,
+) -> bytes:
+    return (json.dumps(item) + "\n").encode("utf-8")
+
+
+def _error_line(
+        exc: Exception,
+) -> bytes:
+    # The status line has long been sent, so a failure part-way through a
+    # stream is reported as its last line instead of a cut connection
+    error = {
+        "type": "error",
+        "status_code": 500,
+        "detail": str(exc) or type(exc).__name__,
+    }
+    if isinstance(exc, Overloaded):
+        error["status_code"] = 503
+        error["retry_after"] = exc.retry_after
+    elif isinstance(exc, HTTPException):
+        error["status_code"] = exc.status_code
+        error["detail"] = exc.detail
+    else:
+        logger.exception("Stream failed part-way through")
+    return _ndjson(error)
+
+
+def _releaser(
+        resources: ExitStack,
+):
+    # A client that disconnects mid-stream leaves the generator parked
+    # between two pages, so its buffer and ticket are freed from the
+    # cancellation instead of waiting for the generator to be collected
+    lock = threading.Lock()
+
+    def release(*_):
+        with lock:
+            resources.close()
+
+    cancellation = current_cancellation.get()
+    if cancellation is not None:
+        cancellation.future.add_done_callback(release)
+    return release
+
+
+def _respond(
+        header: dict,
+        pages: Iterator[dict],
+        resources: ExitStack,
+        stream: bool,
+) -> JSONResponse | StreamingResponse:
+    # resources holds the admission ticket and the shared buffer; they are
+    # released once the last page is out, which for a stream is later
+    if not stream:
+        with resources:
+            response = {
+                **header,
+                "pages": sorted(pages, key=lambda x: x["page_number"]),
+            }
+        return JSONResponse(content=response)
+
+    release = _releaser(resources)
+
+    def lines():
+        # One metadata line, one line per page as soon as its worker is
+        # done, then a summary line; nothing is held beyond the current page
+        started = time.perf_counter()
+        first_page_seconds = None
+        page_count = 0
+        try:
+            yield _ndjson({"type": "metadata", **header})
+            for page in pages:
+                if first_page_seconds is None:
+                    first_page_seconds = time.perf_counter() - started
+                page_count += 1
+                yield _ndjson({"type": "page", **page})
+            yield _ndjson(
+                {
+                    "type": "summary",
+                    "page_count": page_count,
+                    "first_page_seconds": first_page_seconds,
+                    "total_seconds": time.perf_counter() - started,
+                }
+            )
+        except Cancelled:
+            # The client is gone, so there is nobody to report it to
+            return
+        except Exception as e:
+            yield _error_line(e)
+        finally:
+            release()
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(release),
+    )
+
+
+def _complete(
+        pages: list[dict],
+) -> bool:
+    # A result with pages that ran out of time is not kept
+    return not any(page.get("timed_out") for page in pages)
+
+
+def _text_response(
+        source: str,
+        document: PdfBuffer | PdfFile,
+        extractor_class: type[MuExtractor] | type[PyPDFExtractor],
+        max_workers: int,
+        eng_numbering: bool,
+        ocr_mode: OCROption,
+        ocr_language: str,
+        pages: str | None = None,
+        stream: bool = False,
+) -> JSONResponse | StreamingResponse:
+    # Pages are cached individually inside the extractors
+    resources = ExitStack()
+    buffer = resources.enter_context(document)
+    try:
+        resources.enter_context(admission.ticket())
+        extractor = extractor_class(content=buffer)
+        selected = _select_pages(pages, extractor.page_count)
+
+        match ocr_mode:
+            case OCROption.ForceOcr:
+                ocr_extractor = OCRExtractor(content=buffer)
+                results = ocr_extractor.iter_text(
+                    max_workers=max_workers,
+                    lang=ocr_language,
+                    eng_numbering=eng_numbering,
+                    pages=selected,
+                )
+
+            case _:
+                try_ocr = (ocr_mode==OCROption.TryOcr)
+                results = extractor.iter_text(
+                    max_workers=max_workers,
+                    eng_numbering=eng_numbering,
+                    try_ocr=try_ocr,
+                    ocr_language=ocr_language,
+                    pages=selected,
+                )
+
+        header = {
+            "source": source,
+            "metadata": extractor.get_metadata(),
+        }
+    except Exception:
+        resources.close()
+        raise
+
+    return _respond(header, results, resources, stream)
+
+
+def _image_response(
+        source: str,
+        document: PdfBuffer | PdfFile,
+        max_workers: int,
+        pages: str | None = None,
+        stream: bool = False,
+) -> JSONResponse | StreamingResponse:
+    resources = ExitStack()
+    buffer = resources.enter_context(document)
+    try:
+        resources.enter_context(admission.ticket())
+        extractor = MuExtractor(content=buffer)
+        selected = _select_pages(pages, extractor.page_count)
+        key = result_cache.make_key(
+            extractor.digest,
+            backend="MuExtractor.images",
+            pages=selected,
+        )
+        result = result_cache.get(key)
+        if result is None and not stream:
+            result = {
+                "metadata": extractor.get_metadata(),
+                "pages": extractor.extract_image(
+                    max_workers=max_workers,
+                    pages=selected,
+                ),
+            }
+            if _complete(result["pages"]):
+                result_cache.set(key, result)
+    except Exception:
+        resources.close()
+        raise
+
+    if result is not None:
+        header = {
+            "source": source,
+            "metadata": result["metadata"],
+        }
+        return _respond(header, iter(result["pages"]), resources, stream)
+
+    # Streamed pages are not kept around, so a streamed miss is not cached
+    header = {
+        "source": source,
+        "metadata": extractor.get_metadata(),
+    }
+    results = extractor.iter_image(
+        max_workers=max_workers,
+        pages=selected,
+    )
+    return _respond(header, results, resources, stream)
+
+
+def _all_response(
+        source: str,
+        document: PdfBuffer | PdfFile,
+        max_workers: int,
+        text: bool,
+        images: bool,
+        metadata: bool,
+        bounding_boxes: bool,
+        image_data: bool,
+        eng_numbering: bool,
+        pages: str | None = None,
+        stream: bool = False,
+) -> JSONResponse | StreamingResponse:
+    resources = ExitStack()
+    buffer = resources.enter_context(document)
+    try:
+        resources.enter_context(admission.ticket())
+        extractor = MuExtractor(content=buffer)
+        selected = _select_pages(pages, extractor.page_count)
+        options = {
+            "max_workers": max_workers,
+            "text": text,
+            "images": images,
+            "bounding_boxes": bounding_boxes,
+            "image_data": image_data,
+            "eng_numbering": eng_numbering,
+            "pages": selected,
+        }
+        header = {
+            "source": source,
+        }
+        if metadata:
+            header["metadata"] = extractor.get_metadata()
+        key = result_cache.make_key(
+            extractor.digest,
+            backend="MuExtractor.all",
+            **{
+                name: value
+                for name, value in options.items()
+                if name != "max_workers"
+            },
+        )
+        result = result_cache.get(key)
+        if result is None and not stream:
+            result = extractor.extract_all(metadata=False, **options)
+            if _complete(result["pages"]):
+                result_cache.set(key, result)
+    except Exception:
+        resources.close()
+        raise
+
+    if result is not None:
+        return _respond(header, iter(result["pages"]), resources, stream)
+
+    return _respond(header, extractor.iter_all(**options), resources, stream)
+
 
+def _batch_response(
+        feed: BatchFeed,
+        max_workers: int,
+        eng_numbering: bool,
+) -> StreamingResponse:
+    # One NDJSON line per document in the order they finish, then a summary;
+    # documents go into extraction while the rest are still coming in
+    resources = ExitStack()
+    resources.callback(feed.close)
+    try:
+        resources.enter_context(admission.ticket())
+    except Exception:
+        resources.close()
+        raise
+
+    release = _releaser(resources)
+
+    def lines():
+        started = time.perf_counter()
+        failed = 0
+        page_count = 0
+        try:
+            for index, result in iter_batch_text(
+                feed.next,
+                max_workers=max_workers,
+                eng_numbering=eng_numbering,
+            ):
+                # Its pages are out, so its buffer can go right away
+                feed.done(index)
+                if "error" in result:
+                    failed += 1
+                else:
+                    page_count += len(result["pages"])
+                yield _ndjson(
+                    {
+                        "type": "document",
+                        "index": index,
+                        "name": feed.names[index],
+                        **result,
+                    }
+                )
+            yield _ndjson(
+                {
+                    "type": "summary",
+                    "documents": feed.count,
+                    "failed": failed,
+                    "page_count": page_count,
+                    "total_seconds": time.perf_counter() - started,
+                }
+            )
+        except Cancelled:
+            # The client is gone, so there is nobody to report it to
+            return
+        except Exception as e:
+            yield _error_line(e)
+        finally:
+            release()
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(release),
+    )
+
+
+def _ocr_response(
+        source: str,
+        document: PdfBuffer | PdfFile,
+        max_workers: int,
+        language: str,
+        eng_numbering: bool,
+        pages: str | None = None,
+        stream: bool = False,
+) -> JSONResponse | StreamingResponse:
+    resources = ExitStack()
+    buffer = resources.enter_context(document)
+    try:
+        resources.enter_context(admission.ticket())
+        extractor = OCRExtractor(content=buffer)
+        results = extractor.iter_text(
+            max_workers=max_workers,
+            lang=language,
+            eng_numbering=eng_numbering,
+            pages=_select_pages(pages, extractor.page_count),
+        )
+    except Exception:
+        resources.close()
+        raise
 
-TIKA_URL = os.getenv("TIKA_URL", "http://localhost:9998")
-app = FastAPI(title="Document Extractor")
+    return _respond({"source": source}, results, resources, stream)
 
 
 @app.get(
@@ -65,7 +614,9 @@ async def file_to_base64(
 ):
     try:
         file_data = await file.read()
-        base64_string = base64.b64encode(file_data).decode("utf-8")
+        base64_string = (
+            await run_in_threadpool(base64.b64encode, file_data)
+        ).decode("utf-8")
     except Exception:
         raise HTTPException(
             status_code=400,
@@ -141,11 +692,15 @@ async def pypdf_health_check():
 )
 async def tika_health_check():
     try:
-        state = httpx.get(os.path.join(TIKA_URL, "tika"))
+        state = await get_client().get(
+            os.path.join(TIKA_URL, "tika"),
+            timeout=10.0,
+        )
         return JSONResponse(
             status_code=200,
             content={
                 "status": state.text.replace(" Please PUT\n", "").strip(),
+                "servers": tika_servers.stats(),
             }
         )
     except Exception as e:
@@ -167,7 +722,7 @@ async def tika_health_check():
 )
 async def tesseract_health():
     try:
-        version = get_tesseract_version().__str__()
+        version = (await run_in_threadpool(get_tesseract_version)).__str__()
         return JSONResponse(
             status_code=200,
             content={
@@ -184,6 +739,97 @@ async def tesseract_health():
         )
 
 
+@app.get(
+    path="/cache_stats/",
+    tags=[
+        "Health",
+    ]
+)
+async def cache_stats():
+    return JSONResponse(
+        status_code=200,
+        content=result_cache.stats(),
+    )
+
+
+@app.get(
+    path="/admission_stats/",
+    tags=[
+        "Health",
+    ]
+)
+async def admission_stats():
+    return JSONResponse(
+        status_code=200,
+        content=await run_in_threadpool(admission.stats),
+    )
+
+
+@app.get(
+    path="/pool_stats/",
+    tags=[
+        "Health",
+    ]
+)
+async def pool_stats():
+    return JSONResponse(
+        status_code=200,
+        content=get_pool_stats(),
+    )
+
+
+@app.get(
+    path="/http_stats/",
+    tags=[
+        "Health",
+    ]
+)
+async def http_stats():
+    return JSONResponse(
+        status_code=200,
+        content=client_stats(),
+    )
+
+
+@app.get(
+    path="/store_stats/",
+    tags=[
+        "Health",
+    ]
+)
+async def store_stats():
+    return JSONResponse(
+        status_code=200,
+        content=await run_in_threadpool(document_store.stats),
+    )
+
+
+@app.get(
+    path="/coalesce_stats/",
+    tags=[
+        "Health",
+    ]
+)
+async def coalesce_stats():
+    return JSONResponse(
+        status_code=200,
+        content=single_flight.stats(),
+    )
+
+
+@app.get(
+    path="/job_stats/",
+    tags=[
+        "Health",
+    ]
+)
+async def job_stats():
+    return JSONResponse(
+        status_code=200,
+        content=await run_in_threadpool(job_queue.stats),
+    )
+
+
 @app.post(
     path="/extract_text_mu/",
     tags=[
@@ -196,54 +842,42 @@ async def extract_text_mu(
     eng_numbering: bool = Form(False),
     ocr_mode : OCROption = Form(OCROption.NoOcr),
     ocr_language: LanguageOCR = Form(LanguageOCR.Farsi),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
 ):
     if file.content_type != "application/pdf":
         raise HTTPException(
             status_code=400,
             detail="Invalid file type. Only PDF file allowed."
         )
-    
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        content = await file.read()
-
-        if not content.startswith(b"%PDF"):
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid PDF file",
-            )
-        
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = MuExtractor(file_path=tmp.name)
-
-        match ocr_mode:
-            case OCROption.ForceOcr:
-                ocr_extractor = OCRExtractor(file_path=tmp.name)
-                results = ocr_extractor.extract_text(
-                    max_workers=max_workers,
-                    lang=ocr_language.value,
-                    eng_numbering=eng_numbering,
-                )
-
-            case _:
-                try_ocr = (ocr_mode==OCROption.TryOcr)
-                results = extractor.extract_text(
-                    max_workers=max_workers,
-                    eng_numbering=eng_numbering,
-                    try_ocr=try_ocr,
-                    ocr_language=ocr_language.value,
-                )
 
-        response = {
-            "source": "uploaded file",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
+    document = await ingest_upload(file)
 
-    return JSONResponse(content=response)
+    return await _coalesce(
+        document.digest,
+        "extract_text_mu",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": ocr_mode,
+            "ocr_language": ocr_language.value,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _text_response,
+            source="uploaded file",
+            document=document,
+            extractor_class=MuExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=ocr_mode,
+            ocr_language=ocr_language.value,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
 
 @app.post(
@@ -255,169 +889,171 @@ async def extract_text_mu(
 async def extract_image_mu(
     file: UploadFile = File(...),
     max_workers: int = Form(32),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
 ):
     if file.content_type != "application/pdf":
         raise HTTPException(
             status_code=400,
             detail="Invalid file type. Only PDF file allowed."
         )
-    
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        content = await file.read()
-
-        if not content.startswith(b"%PDF"):
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid PDF file",
-            )
-        
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = MuExtractor(file_path=tmp.name)
-        results = extractor.extract_image(max_workers=max_workers)
 
-        response = {
-            "source": "uploaded file",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
+    document = await ingest_upload(file)
 
-    return JSONResponse(content=response)
+    return await _coalesce(
+        document.digest,
+        "extract_image_mu",
+        {
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _image_response,
+            source="uploaded file",
+            document=document,
+            max_workers=max_workers,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
 
 @app.post(
-    path="/extract_text_url_mu/",
+    path="/extract_all_mu/",
     tags=[
         "PyMuPDF",
     ]
 )
-async def extract_text_url_mu(
-    url: str = Form(...),
+async def extract_all_mu(
+    file: UploadFile = File(...),
     max_workers: int = Form(32),
+    text: bool = Form(True),
+    images: bool = Form(True),
+    metadata: bool = Form(True),
+    bounding_boxes: bool = Form(True),
+    image_data: bool = Form(True),
     eng_numbering: bool = Form(False),
-    ocr_mode : OCROption = Form(OCROption.NoOcr),
-    ocr_language: LanguageOCR = Form(LanguageOCR.Farsi),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
 ):
-    try:
-        async with httpx.AsyncClient(
-            timeout=30.0
-        ) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Could not fetch file from URL: {response.reason_phrase}",
-                )
-            content = response.content
-    except httpx.RequestError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Request error: {e}",
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {e}",
-        )
-    
-    if not content.startswith(b"%PDF"):
+    if file.content_type != "application/pdf":
         raise HTTPException(
             status_code=400,
-            detail="Invalid PDF file",
+            detail="Invalid file type. Only PDF file allowed."
         )
-    
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = MuExtractor(file_path=tmp.name)
-
-        match ocr_mode:
-            case OCROption.ForceOcr:
-                ocr_extractor = OCRExtractor(file_path=tmp.name)
-                results = ocr_extractor.extract_text(
-                    max_workers=max_workers,
-                    lang=ocr_language.value,
-                    eng_numbering=eng_numbering,
-                )
-
-            case _:
-                try_ocr = (ocr_mode==OCROption.TryOcr)
-                results = extractor.extract_text(
-                    max_workers=max_workers,
-                    eng_numbering=eng_numbering,
-                    try_ocr=try_ocr,
-                    ocr_language=ocr_language.value,
-                )
 
-        response = {
-            "source": "url",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
+    document = await ingest_upload(file)
 
-    return JSONResponse(response)
+    return await _coalesce(
+        document.digest,
+        "extract_all_mu",
+        {
+            "text": text,
+            "images": images,
+            "metadata": metadata,
+            "bounding_boxes": bounding_boxes,
+            "image_data": image_data,
+            "eng_numbering": eng_numbering,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _all_response,
+            source="uploaded file",
+            document=document,
+            max_workers=max_workers,
+            text=text,
+            images=images,
+            metadata=metadata,
+            bounding_boxes=bounding_boxes,
+            image_data=image_data,
+            eng_numbering=eng_numbering,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
 
 @app.post(
-    path="/extract_image_url_mu/",
+    path="/extract_text_url_mu/",
     tags=[
         "PyMuPDF",
     ]
 )
-async def extract_image_url_mu(
+async def extract_text_url_mu(
     url: str = Form(...),
     max_workers: int = Form(32),
-):
-    try:
-        async with httpx.AsyncClient(
-            timeout=30.0
-        ) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Could not fetch file from URL: {response.reason_phrase}",
-                )
-            content = response.content
-    except httpx.RequestError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Request error: {e}",
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {e}",
-        )
-    
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
+    eng_numbering: bool = Form(False),
+    ocr_mode : OCROption = Form(OCROption.NoOcr),
+    ocr_language: LanguageOCR = Form(LanguageOCR.Farsi),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
+):
+    async def respond():
+        document = await ingest_url(url)
+        return await run_in_threadpool(
+            _text_response,
+            source="url",
+            document=document,
+            extractor_class=MuExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=ocr_mode,
+            ocr_language=ocr_language.value,
+            pages=pages,
+            stream=stream,
         )
-    
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
 
-        extractor = MuExtractor(file_path=tmp.name)
-        results = extractor.extract_image(max_workers=max_workers)
+    return await _coalesce(
+        f"url:{url}",
+        "extract_text_url_mu",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": ocr_mode,
+            "ocr_language": ocr_language.value,
+            "pages": pages,
+        },
+        stream,
+        respond,
+    )
 
-        response = {
-            "source": "url",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
 
-    return JSONResponse(response)
+@app.post(
+    path="/extract_image_url_mu/",
+    tags=[
+        "PyMuPDF",
+    ]
+)
+async def extract_image_url_mu(
+    url: str = Form(...),
+    max_workers: int = Form(32),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
+):
+    async def respond():
+        document = await ingest_url(url)
+        return await run_in_threadpool(
+            _image_response,
+            source="url",
+            document=document,
+            max_workers=max_workers,
+            pages=pages,
+            stream=stream,
+        )
+
+    return await _coalesce(
+        f"url:{url}",
+        "extract_image_url_mu",
+        {
+            "pages": pages,
+        },
+        stream,
+        respond,
+    )
 
 
 @app.post(
@@ -432,54 +1068,36 @@ async def extract_text_base64_mu(
     eng_numbering: bool = Form(False),
     ocr_mode : OCROption = Form(OCROption.NoOcr),
     ocr_language: LanguageOCR = Form(LanguageOCR.Farsi),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
 ):
-    try:
-        content = base64.b64decode(base64_pdf)
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
-
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
-
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = MuExtractor(file_path=tmp.name)
-
-        match ocr_mode:
-            case OCROption.ForceOcr:
-                ocr_extractor = OCRExtractor(file_path=tmp.name)
-                results = ocr_extractor.extract_text(
-                    max_workers=max_workers,
-                    lang=ocr_language.value,
-                    eng_numbering=eng_numbering,
-                )
-
-            case _:
-                try_ocr = (ocr_mode==OCROption.TryOcr)
-                results = extractor.extract_text(
-                    max_workers=max_workers,
-                    eng_numbering=eng_numbering,
-                    try_ocr=try_ocr,
-                    ocr_language=ocr_language.value,
-                )
-
-        response = {
-            "source": "base64 input",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
+    document = await ingest_base64(base64_pdf)
 
-    return JSONResponse(content=response)
+    return await _coalesce(
+        document.digest,
+        "extract_text_base64_mu",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": ocr_mode,
+            "ocr_language": ocr_language.value,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _text_response,
+            source="base64 input",
+            document=document,
+            extractor_class=MuExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=ocr_mode,
+            ocr_language=ocr_language.value,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
 
 @app.post(
@@ -491,37 +1109,29 @@ async def extract_text_base64_mu(
 async def extract_image_base64_mu(
     base64_pdf: str = Form(...),
     max_workers: int = Form(32),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
 ):
-    try:
-        content = base64.b64decode(base64_pdf)
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
-
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
+    document = await ingest_base64(base64_pdf)
 
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = MuExtractor(file_path=tmp.name)
-        results = extractor.extract_image(max_workers=max_workers)
-
-        response = {
-            "source": "base64 input",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
-
-    return JSONResponse(content=response)
+    return await _coalesce(
+        document.digest,
+        "extract_image_base64_mu",
+        {
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _image_response,
+            source="base64 input",
+            document=document,
+            max_workers=max_workers,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
 
 @app.post(
@@ -535,6 +1145,8 @@ async def extract_text_url_json_mu(
 ):
     url = request.url
     max_workers = request.max_workers
+    pages = request.pages
+    stream = request.stream
     eng_numbering = request.eng_numbering
     ocr_mode = request.ocr_mode
     ocr_language = request.ocr_language
@@ -563,67 +1175,33 @@ async def extract_text_url_json_mu(
                 },
             )
 
-    try:
-        async with httpx.AsyncClient(
-            timeout=30.0
-        ) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Could not fetch file from URL: {response.reason_phrase}",
-                )
-            content = response.content
-    except httpx.RequestError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Request error: {e}",
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {e}",
-        )
-    
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
+    async def respond():
+        document = await ingest_url(url)
+        return await run_in_threadpool(
+            _text_response,
+            source="url",
+            document=document,
+            extractor_class=MuExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=OCROption(ocr_mode),
+            ocr_language=ocr_language,
+            pages=pages,
+            stream=stream,
         )
-    
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = MuExtractor(file_path=tmp.name)
-
-        match ocr_mode:
-            case OCROption.ForceOcr.value:
-                ocr_extractor = OCRExtractor(file_path=tmp.name)
-                results = ocr_extractor.extract_text(
-                    max_workers=max_workers,
-                    lang=ocr_language,
-                    eng_numbering=eng_numbering,
-                )
 
-            case _:
-                try_ocr = (ocr_mode==OCROption.TryOcr.value)
-                results = extractor.extract_text(
-                    max_workers=max_workers,
-                    eng_numbering=eng_numbering,
-                    try_ocr=try_ocr,
-                    ocr_language=ocr_language,
-                )
-
-        response = {
-            "source": "url",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
-
-    return JSONResponse(response)
+    return await _coalesce(
+        f"url:{url}",
+        "extract_text_url_json_mu",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": OCROption(ocr_mode),
+            "ocr_language": ocr_language,
+            "pages": pages,
+        },
+        stream,
+        respond,
+    )
 
 
 @app.post(
@@ -637,50 +1215,28 @@ async def extract_image_url_json_mu(
 ):
     url = request.url
     max_workers = request.max_workers
-    try:
-        async with httpx.AsyncClient(
-            timeout=30.0
-        ) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Could not fetch file from URL: {response.reason_phrase}",
-                )
-            content = response.content
-    except httpx.RequestError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Request error: {e}",
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {e}",
-        )
-    
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
+    pages = request.pages
+    stream = request.stream
+    async def respond():
+        document = await ingest_url(url)
+        return await run_in_threadpool(
+            _image_response,
+            source="url",
+            document=document,
+            max_workers=max_workers,
+            pages=pages,
+            stream=stream,
         )
-    
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = MuExtractor(file_path=tmp.name)
-        results = extractor.extract_image(max_workers=max_workers)
-
-        response = {
-            "source": "url",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
 
-    return JSONResponse(response)
+    return await _coalesce(
+        f"url:{url}",
+        "extract_image_url_json_mu",
+        {
+            "pages": pages,
+        },
+        stream,
+        respond,
+    )
 
 
 @app.post(
@@ -694,6 +1250,8 @@ async def extract_text_base64_json_mu(
 ):
     base64_pdf = request.base64_pdf
     max_workers = request.max_workers
+    pages = request.pages
+    stream = request.stream
     eng_numbering = request.eng_numbering
     ocr_mode = request.ocr_mode
     ocr_language = request.ocr_language
@@ -722,53 +1280,33 @@ async def extract_text_base64_json_mu(
                 },
             )
     
-    try:
-        content = base64.b64decode(base64_pdf)
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
-
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
-
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = MuExtractor(file_path=tmp.name)
-
-        match ocr_mode:
-            case OCROption.ForceOcr.value:
-                ocr_extractor = OCRExtractor(file_path=tmp.name)
-                results = ocr_extractor.extract_text(
-                    max_workers=max_workers,
-                    lang=ocr_language,
-                    eng_numbering=eng_numbering,
-                )
-
-            case _:
-                try_ocr = (ocr_mode==OCROption.TryOcr.value)
-                results = extractor.extract_text(
-                    max_workers=max_workers,
-                    eng_numbering=eng_numbering,
-                    try_ocr=try_ocr,
-                    ocr_language=ocr_language,
-                )
-
-        response = {
-            "source": "base64 input",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
+    document = await ingest_base64(base64_pdf)
 
-    return JSONResponse(content=response)
+    return await _coalesce(
+        document.digest,
+        "extract_text_base64_json_mu",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": OCROption(ocr_mode),
+            "ocr_language": ocr_language,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _text_response,
+            source="base64 input",
+            document=document,
+            extractor_class=MuExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=OCROption(ocr_mode),
+            ocr_language=ocr_language,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
 
 @app.post(
@@ -782,36 +1320,172 @@ async def extract_image_base64_json_mu(
 ):
     base64_pdf = request.base64_pdf
     max_workers = request.max_workers
-    try:
-        content = base64.b64decode(base64_pdf)
-    except Exception as e:
+    pages = request.pages
+    stream = request.stream
+    document = await ingest_base64(base64_pdf)
+
+    return await _coalesce(
+        document.digest,
+        "extract_image_base64_json_mu",
+        {
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _image_response,
+            source="base64 input",
+            document=document,
+            max_workers=max_workers,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
+
+
+@app.post(
+    path="/extract_text_raw_mu/",
+    tags=[
+        "PyMuPDF",
+    ]
+)
+async def extract_text_raw_mu(
+    request: Request,
+    max_workers: int = 32,
+    eng_numbering: bool = False,
+    ocr_mode : OCROption = OCROption.NoOcr,
+    ocr_language: LanguageOCR = LanguageOCR.Farsi,
+    pages: str | None = None,
+    stream: bool = False,
+):
+    if request.headers.get("Content-Type", "").split(";")[0] != "application/pdf":
         raise HTTPException(
             status_code=400,
-            detail="Invalid PDF file",
+            detail="Invalid file type. Only PDF file allowed."
         )
 
-    if not content.startswith(b"%PDF"):
+    document = await ingest_request(request)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_raw_mu",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": ocr_mode,
+            "ocr_language": ocr_language.value,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _text_response,
+            source="raw body",
+            document=document,
+            extractor_class=MuExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=ocr_mode,
+            ocr_language=ocr_language.value,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
+
+
+@app.post(
+    path="/extract_image_raw_mu/",
+    tags=[
+        "PyMuPDF",
+    ]
+)
+async def extract_image_raw_mu(
+    request: Request,
+    max_workers: int = 32,
+    pages: str | None = None,
+    stream: bool = False,
+):
+    if request.headers.get("Content-Type", "").split(";")[0] != "application/pdf":
         raise HTTPException(
             status_code=400,
-            detail="Invalid PDF file",
+            detail="Invalid file type. Only PDF file allowed."
         )
 
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
+    document = await ingest_request(request)
 
-        extractor = MuExtractor(file_path=tmp.name)
-        results = extractor.extract_image(max_workers=max_workers)
+    return await _coalesce(
+        document.digest,
+        "extract_image_raw_mu",
+        {
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _image_response,
+            source="raw body",
+            document=document,
+            max_workers=max_workers,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
-        response = {
-            "source": "base64 input",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
 
-    return JSONResponse(content=response)
+@app.post(
+    path="/extract_text_batch_mu/",
+    tags=[
+        "PyMuPDF",
+    ]
+)
+async def extract_text_batch_mu(
+    files: list[UploadFile] | None = File(None),
+    archive: UploadFile | None = File(None),
+    urls: list[str] | None = Form(None),
+    max_workers: int = Form(32),
+    eng_numbering: bool = Form(False),
+):
+    sources = [source for source in (files, archive, urls) if source]
+    if len(sources) != 1:
+        raise HTTPException(
+            status_code=422,
+            detail="Exactly one of files, archive or urls is required",
+        )
+
+    if files:
+        documents = ingest_uploads(files)
+    elif archive is not None:
+        documents = await ingest_archive(archive)
+    else:
+        documents = ingest_urls(urls)
+
+    return await run_in_threadpool(
+        _batch_response,
+        feed=BatchFeed(documents),
+        max_workers=max_workers,
+        eng_numbering=eng_numbering,
+    )
+
+
+@app.post(
+    path="/extract_text_batch_url_json_mu/",
+    tags=[
+        "PyMuPDF",
+    ]
+)
+async def extract_text_batch_url_json_mu(
+    request: JsonRequestTextBatchUrl,
+):
+    documents = ingest_urls(request.urls)
+
+    return await run_in_threadpool(
+        _batch_response,
+        feed=BatchFeed(documents),
+        max_workers=request.max_workers,
+        eng_numbering=request.eng_numbering,
+    )
 
 
 @app.post(
@@ -826,6 +1500,8 @@ async def extract_text_pypdf(
     eng_numbering: bool = Form(False),
     ocr_mode : OCROption = Form(OCROption.NoOcr),
     ocr_language: LanguageOCR = Form(LanguageOCR.Farsi),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
 ):
     if file.content_type != "application/pdf":
         raise HTTPException(
@@ -833,47 +1509,33 @@ async def extract_text_pypdf(
             detail="Invalid file type. Only PDF file allowed."
         )
 
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        content = await file.read()
-
-        if not content.startswith(b"%PDF"):
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid PDF file",
-            )
-        
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = PyPDFExtractor(file_path=tmp.name)
+    document = await ingest_upload(file)
 
-        match ocr_mode:
-            case OCROption.ForceOcr:
-                ocr_extractor = OCRExtractor(file_path=tmp.name)
-                results = ocr_extractor.extract_text(
-                    max_workers=max_workers,
-                    lang=ocr_language.value,
-                    eng_numbering=eng_numbering,
-                )
-
-            case _:
-                try_ocr = (ocr_mode==OCROption.TryOcr)
-                results = extractor.extract_text(
-                    max_workers=max_workers,
-                    eng_numbering=eng_numbering,
-                    try_ocr=try_ocr,
-                    ocr_language=ocr_language.value,
-                )
-
-        response = {
-            "source": "uploaded file",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
-
-    return JSONResponse(content=response)
+    return await _coalesce(
+        document.digest,
+        "extract_text_pypdf",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": ocr_mode,
+            "ocr_language": ocr_language.value,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _text_response,
+            source="uploaded file",
+            document=document,
+            extractor_class=PyPDFExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=ocr_mode,
+            ocr_language=ocr_language.value,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
 
 @app.post(
@@ -888,68 +1550,36 @@ async def extract_text_url_pypdf(
     eng_numbering: bool = Form(False),
     ocr_mode : OCROption = Form(OCROption.NoOcr),
     ocr_language: LanguageOCR = Form(LanguageOCR.Farsi),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
 ):
-    try:
-        async with httpx.AsyncClient(
-            timeout=30.0
-        ) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Could not fetch file from URL: {response.reason_phrase}",
-                )
-            content = response.content
-    except httpx.RequestError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Request error: {e}",
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {e}",
-        )
-    
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
+    async def respond():
+        document = await ingest_url(url)
+        return await run_in_threadpool(
+            _text_response,
+            source="url",
+            document=document,
+            extractor_class=PyPDFExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=ocr_mode,
+            ocr_language=ocr_language.value,
+            pages=pages,
+            stream=stream,
         )
-    
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = PyPDFExtractor(file_path=tmp.name)
-
-        match ocr_mode:
-            case OCROption.ForceOcr:
-                ocr_extractor = OCRExtractor(file_path=tmp.name)
-                results = ocr_extractor.extract_text(
-                    max_workers=max_workers,
-                    lang=ocr_language.value,
-                    eng_numbering=eng_numbering,
-                )
-
-            case _:
-                try_ocr = (ocr_mode==OCROption.TryOcr)
-                results = extractor.extract_text(
-                    max_workers=max_workers,
-                    eng_numbering=eng_numbering,
-                    try_ocr=try_ocr,
-                    ocr_language=ocr_language.value,
-                )
-
-        response = {
-            "source": "url",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
 
-    return JSONResponse(response)
+    return await _coalesce(
+        f"url:{url}",
+        "extract_text_url_pypdf",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": ocr_mode,
+            "ocr_language": ocr_language.value,
+            "pages": pages,
+        },
+        stream,
+        respond,
+    )
 
 
 @app.post(
@@ -964,54 +1594,36 @@ async def extract_text_base64_pypdf(
     eng_numbering: bool = Form(False),
     ocr_mode : OCROption = Form(OCROption.NoOcr),
     ocr_language: LanguageOCR = Form(LanguageOCR.Farsi),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
 ):
-    try:
-        content = base64.b64decode(base64_pdf)
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
-
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
-
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = PyPDFExtractor(file_path=tmp.name)
-
-        match ocr_mode:
-            case OCROption.ForceOcr:
-                ocr_extractor = OCRExtractor(file_path=tmp.name)
-                results = ocr_extractor.extract_text(
-                    max_workers=max_workers,
-                    lang=ocr_language.value,
-                    eng_numbering=eng_numbering,
-                )
-
-            case _:
-                try_ocr = (ocr_mode==OCROption.TryOcr)
-                results = extractor.extract_text(
-                    max_workers=max_workers,
-                    eng_numbering=eng_numbering,
-                    try_ocr=try_ocr,
-                    ocr_language=ocr_language.value,
-                )
-
-        response = {
-            "source": "base64 input",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
+    document = await ingest_base64(base64_pdf)
 
-    return JSONResponse(content=response)
+    return await _coalesce(
+        document.digest,
+        "extract_text_base64_pypdf",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": ocr_mode,
+            "ocr_language": ocr_language.value,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _text_response,
+            source="base64 input",
+            document=document,
+            extractor_class=PyPDFExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=ocr_mode,
+            ocr_language=ocr_language.value,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
 
 @app.post(
@@ -1025,6 +1637,8 @@ async def extract_text_url_json_pypdf(
 ):
     url = request.url
     max_workers = request.max_workers
+    pages = request.pages
+    stream = request.stream
     eng_numbering = request.eng_numbering
     ocr_mode = request.ocr_mode
     ocr_language = request.ocr_language
@@ -1053,67 +1667,33 @@ async def extract_text_url_json_pypdf(
                 },
             )
 
-    try:
-        async with httpx.AsyncClient(
-            timeout=30.0
-        ) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Could not fetch file from URL: {response.reason_phrase}",
-                )
-            content = response.content
-    except httpx.RequestError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Request error: {e}",
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {e}",
-        )
-    
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
+    async def respond():
+        document = await ingest_url(url)
+        return await run_in_threadpool(
+            _text_response,
+            source="url",
+            document=document,
+            extractor_class=PyPDFExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=OCROption(ocr_mode),
+            ocr_language=ocr_language,
+            pages=pages,
+            stream=stream,
         )
-    
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = PyPDFExtractor(file_path=tmp.name)
-        
-        match ocr_mode:
-            case OCROption.ForceOcr.value:
-                ocr_extractor = OCRExtractor(file_path=tmp.name)
-                results = ocr_extractor.extract_text(
-                    max_workers=max_workers,
-                    lang=ocr_language,
-                    eng_numbering=eng_numbering,
-                )
-
-            case _:
-                try_ocr = (ocr_mode==OCROption.TryOcr.value)
-                results = extractor.extract_text(
-                    max_workers=max_workers,
-                    eng_numbering=eng_numbering,
-                    try_ocr=try_ocr,
-                    ocr_language=ocr_language,
-                )
-
-        response = {
-            "source": "url",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
 
-    return JSONResponse(response)
+    return await _coalesce(
+        f"url:{url}",
+        "extract_text_url_json_pypdf",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": OCROption(ocr_mode),
+            "ocr_language": ocr_language,
+            "pages": pages,
+        },
+        stream,
+        respond,
+    )
 
 
 @app.post(
@@ -1127,6 +1707,8 @@ async def extract_text_base64_json_pypdf(
 ):
     base64_pdf = request.base64_pdf
     max_workers = request.max_workers
+    pages = request.pages
+    stream = request.stream
     eng_numbering = request.eng_numbering
     ocr_mode = request.ocr_mode
     ocr_language = request.ocr_language
@@ -1155,53 +1737,83 @@ async def extract_text_base64_json_pypdf(
                 },
             )
     
-    try:
-        content = base64.b64decode(base64_pdf)
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
+    document = await ingest_base64(base64_pdf)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_base64_json_pypdf",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": OCROption(ocr_mode),
+            "ocr_language": ocr_language,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _text_response,
+            source="base64 input",
+            document=document,
+            extractor_class=PyPDFExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=OCROption(ocr_mode),
+            ocr_language=ocr_language,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
+
 
-    if not content.startswith(b"%PDF"):
+@app.post(
+    path="/extract_text_raw_pypdf/",
+    tags=[
+        "PyPDF2",
+    ]
+)
+async def extract_text_raw_pypdf(
+    request: Request,
+    max_workers: int = 32,
+    eng_numbering: bool = False,
+    ocr_mode : OCROption = OCROption.NoOcr,
+    ocr_language: LanguageOCR = LanguageOCR.Farsi,
+    pages: str | None = None,
+    stream: bool = False,
+):
+    if request.headers.get("Content-Type", "").split(";")[0] != "application/pdf":
         raise HTTPException(
             status_code=400,
-            detail="Invalid PDF file",
+            detail="Invalid file type. Only PDF file allowed."
         )
 
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = PyPDFExtractor(file_path=tmp.name)
-        
-        match ocr_mode:
-            case OCROption.ForceOcr.value:
-                ocr_extractor = OCRExtractor(file_path=tmp.name)
-                results = ocr_extractor.extract_text(
-                    max_workers=max_workers,
-                    lang=ocr_language,
-                    eng_numbering=eng_numbering,
-                )
-
-            case _:
-                try_ocr = (ocr_mode==OCROption.TryOcr.value)
-                results = extractor.extract_text(
-                    max_workers=max_workers,
-                    eng_numbering=eng_numbering,
-                    try_ocr=try_ocr,
-                    ocr_language=ocr_language,
-                )
-
-        response = {
-            "source": "base64 input",
-            "metadata": extractor.get_metadata(),
-            "pages": results,
-        }
+    document = await ingest_request(request)
 
-    return JSONResponse(content=response)
+    return await _coalesce(
+        document.digest,
+        "extract_text_raw_pypdf",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": ocr_mode,
+            "ocr_language": ocr_language.value,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _text_response,
+            source="raw body",
+            document=document,
+            extractor_class=PyPDFExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=ocr_mode,
+            ocr_language=ocr_language.value,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
 
 @app.post(
@@ -1218,17 +1830,10 @@ async def extract_text_tika(
     if not ext:
         ext = ""
     
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp.flush()
-
-        parsed_doc = parser.from_file(
-            tmp.name,
-            serverEndpoint=TIKA_URL,
-        )
+    document = await ingest_upload(file, pdf_only=False, spool=True)
+
+    async def respond():
+        parsed_doc = await parse_document(document)
 
         content = digits_to_latin(
             parsed_doc.get("content")
@@ -1238,9 +1843,21 @@ async def extract_text_tika(
             "source": "uploaded file",
             "metadata": parsed_doc.get("metadata"),
             "content": content,
+            "extractor": parsed_doc.get("extractor"),
         }
 
-    return JSONResponse(content=response)
+        return JSONResponse(content=response)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_tika",
+        {
+            "eng_numbering": eng_numbering,
+        },
+        False,
+        respond,
+        document,
+    )
 
 
 @app.post(
@@ -1253,44 +1870,33 @@ async def extract_text_url_tika(
     url: str = Form(...),
     eng_numbering: bool = Form(False),
 ):
-    try:
-        async with httpx.AsyncClient(
-            timeout=30.0
-        ) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Could not fetch file from URL: {response.reason_phrase}",
-                )
-            content = response.content
-    except httpx.RequestError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Request error: {e}",
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {e}",
-        )
-    
-    parsed_doc = parser.from_buffer(
-        content,
-        serverEndpoint=TIKA_URL,
-    )
+    async def respond():
+        document = await ingest_url(url, pdf_only=False, spool=True)
 
-    content = digits_to_latin(
-        parsed_doc.get("content")
-    ) if eng_numbering else parsed_doc.get("content")
+        parsed_doc = await parse_document(document)
 
-    response = {
-        "source": "uploaded file",
-        "metadata": parsed_doc.get("metadata"),
-        "content": content,
-    }
+        content = digits_to_latin(
+            parsed_doc.get("content")
+        ) if eng_numbering else parsed_doc.get("content")
+
+        response = {
+            "source": "uploaded file",
+            "metadata": parsed_doc.get("metadata"),
+            "content": content,
+            "extractor": parsed_doc.get("extractor"),
+        }
 
-    return JSONResponse(response)
+        return JSONResponse(response)
+
+    return await _coalesce(
+        f"url:{url}",
+        "extract_text_url_tika",
+        {
+            "eng_numbering": eng_numbering,
+        },
+        False,
+        respond,
+    )
 
 
 @app.post(
@@ -1303,30 +1909,34 @@ async def extract_text_base64_tika(
     base64_pdf: str = Form(...),
     eng_numbering: bool = Form(False),
 ):
-    try:
-        content = base64.b64decode(base64_pdf)
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
+    document = await ingest_base64(base64_pdf, pdf_only=False, spool=True)
 
-    parsed_doc = parser.from_buffer(
-        content,
-        serverEndpoint=TIKA_URL,
-    )
+    async def respond():
+        parsed_doc = await parse_document(document)
 
-    content = digits_to_latin(
-        parsed_doc.get("content")
-    ) if eng_numbering else parsed_doc.get("content")
+        content = digits_to_latin(
+            parsed_doc.get("content")
+        ) if eng_numbering else parsed_doc.get("content")
 
-    response = {
-        "source": "uploaded file",
-        "metadata": parsed_doc.get("metadata"),
-        "content": content,
-    }
+        response = {
+            "source": "uploaded file",
+            "metadata": parsed_doc.get("metadata"),
+            "content": content,
+            "extractor": parsed_doc.get("extractor"),
+        }
 
-    return JSONResponse(content=response)
+        return JSONResponse(content=response)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_base64_tika",
+        {
+            "eng_numbering": eng_numbering,
+        },
+        False,
+        respond,
+        document,
+    )
 
 
 @app.post(
@@ -1340,44 +1950,33 @@ async def extract_text_url_json_tika(
 ):
     url = request.url
     eng_numbering = request.eng_numbering
-    try:
-        async with httpx.AsyncClient(
-            timeout=30.0
-        ) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Could not fetch file from URL: {response.reason_phrase}",
-                )
-            content = response.content
-    except httpx.RequestError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Request error: {e}",
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {e}",
-        )
-    
-    parsed_doc = parser.from_buffer(
-        content,
-        serverEndpoint=TIKA_URL,
-    )
+    async def respond():
+        document = await ingest_url(url, pdf_only=False, spool=True)
 
-    content = digits_to_latin(
-        parsed_doc.get("content")
-    ) if eng_numbering else parsed_doc.get("content")
+        parsed_doc = await parse_document(document)
 
-    response = {
-        "source": "uploaded file",
-        "metadata": parsed_doc.get("metadata"),
-        "content": content,
-    }
+        content = digits_to_latin(
+            parsed_doc.get("content")
+        ) if eng_numbering else parsed_doc.get("content")
+
+        response = {
+            "source": "uploaded file",
+            "metadata": parsed_doc.get("metadata"),
+            "content": content,
+            "extractor": parsed_doc.get("extractor"),
+        }
+
+        return JSONResponse(response)
 
-    return JSONResponse(response)
+    return await _coalesce(
+        f"url:{url}",
+        "extract_text_url_json_tika",
+        {
+            "eng_numbering": eng_numbering,
+        },
+        False,
+        respond,
+    )
 
 
 @app.post(
@@ -1391,30 +1990,75 @@ async def extract_text_base64_json_tika(
 ):
     base64_pdf = request.base64_pdf
     eng_numbering = request.eng_numbering
-    try:
-        content = base64.b64decode(base64_pdf)
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
+    document = await ingest_base64(base64_pdf, pdf_only=False, spool=True)
+
+    async def respond():
+        parsed_doc = await parse_document(document)
+
+        content = digits_to_latin(
+            parsed_doc.get("content")
+        ) if eng_numbering else parsed_doc.get("content")
+
+        response = {
+            "source": "uploaded file",
+            "metadata": parsed_doc.get("metadata"),
+            "content": content,
+            "extractor": parsed_doc.get("extractor"),
+        }
 
-    parsed_doc = parser.from_buffer(
-        content,
-        serverEndpoint=TIKA_URL,
+        return JSONResponse(content=response)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_base64_json_tika",
+        {
+            "eng_numbering": eng_numbering,
+        },
+        False,
+        respond,
+        document,
     )
 
-    content = digits_to_latin(
-        parsed_doc.get("content")
-    ) if eng_numbering else parsed_doc.get("content")
 
-    response = {
-        "source": "uploaded file",
-        "metadata": parsed_doc.get("metadata"),
-        "content": content,
-    }
+@app.post(
+    path="/extract_text_raw_tika/",
+    tags=[
+        "Apache Tika",
+    ]
+)
+async def extract_text_raw_tika(
+    request: Request,
+    eng_numbering: bool = False,
+):
+    # Tika accepts any document type, so the body is taken as is
+    document = await ingest_request(request, pdf_only=False, spool=True)
 
-    return JSONResponse(content=response)
+    async def respond():
+        parsed_doc = await parse_document(document)
+
+        content = digits_to_latin(
+            parsed_doc.get("content")
+        ) if eng_numbering else parsed_doc.get("content")
+
+        response = {
+            "source": "raw body",
+            "metadata": parsed_doc.get("metadata"),
+            "content": content,
+            "extractor": parsed_doc.get("extractor"),
+        }
+
+        return JSONResponse(content=response)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_raw_tika",
+        {
+            "eng_numbering": eng_numbering,
+        },
+        False,
+        respond,
+        document,
+    )
 
 
 @app.post(
@@ -1428,6 +2072,8 @@ async def extract_text_tesseract(
     max_workers: int = Form(32),
     eng_numbering: bool = Form(False),
     language: LanguageOCR = Form(LanguageOCR.Farsi),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
 ):
     if file.content_type != "application/pdf":
         raise HTTPException(
@@ -1435,33 +2081,30 @@ async def extract_text_tesseract(
             detail="Invalid file type. Only PDF file allowed."
         )
 
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        content = await file.read()
-
-        if not content.startswith(b"%PDF"):
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid PDF file",
-            )
-        
-        tmp.write(content)
-        tmp.flush()
+    document = await ingest_upload(file)
 
-        extractor = OCRExtractor(file_path=tmp.name)
-        results = extractor.extract_text(
+    return await _coalesce(
+        document.digest,
+        "extract_text_tesseract",
+        {
+            "language": language.value,
+            "eng_numbering": eng_numbering,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _ocr_response,
+            source="uploaded file",
+            document=document,
             max_workers=max_workers,
-            lang=language.value,
+            language=language.value,
             eng_numbering=eng_numbering,
-        )
-
-        response = {
-            "source": "uploaded file",
-            "pages": results,
-        }
-
-    return JSONResponse(content=response)
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
 
 @app.post(
@@ -1475,54 +2118,33 @@ async def extract_text_url_tesseract(
     max_workers: int = Form(32),
     eng_numbering: bool = Form(False),
     language: LanguageOCR = Form(LanguageOCR.Farsi.value),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
 ):
-    try:
-        async with httpx.AsyncClient(
-            timeout=30.0
-        ) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Could not fetch file from URL: {response.reason_phrase}",
-                )
-            content = response.content
-    except httpx.RequestError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Request error: {e}",
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {e}",
-        )
-    
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
-    
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = OCRExtractor(file_path=tmp.name)
-        results = extractor.extract_text(
+    async def respond():
+        document = await ingest_url(url)
+        return await run_in_threadpool(
+            _ocr_response,
+            source="url",
+            document=document,
             max_workers=max_workers,
-            lang=language.value,
+            language=language.value,
             eng_numbering=eng_numbering,
+            pages=pages,
+            stream=stream,
         )
 
-        response = {
-            "source": "url",
-            "pages": results,
-        }
-
-    return JSONResponse(response)
+    return await _coalesce(
+        f"url:{url}",
+        "extract_text_url_tesseract",
+        {
+            "language": language.value,
+            "eng_numbering": eng_numbering,
+            "pages": pages,
+        },
+        stream,
+        respond,
+    )
 
 
 @app.post(
@@ -1536,40 +2158,33 @@ async def extract_text_base64_tesseract(
     max_workers: int = Form(32),
     eng_numbering: bool = Form(False),
     language: LanguageOCR = Form(LanguageOCR.Farsi.value),
+    pages: str | None = Form(None),
+    stream: bool = Form(False),
 ):
-    try:
-        content = base64.b64decode(base64_pdf)
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
-
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
-
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
+    document = await ingest_base64(base64_pdf)
 
-        extractor = OCRExtractor(file_path=tmp.name)
-        results = extractor.extract_text(
+    return await _coalesce(
+        document.digest,
+        "extract_text_base64_tesseract",
+        {
+            "language": language.value,
+            "eng_numbering": eng_numbering,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _ocr_response,
+            source="base64 input",
+            document=document,
             max_workers=max_workers,
-            lang=language.value,
+            language=language.value,
             eng_numbering=eng_numbering,
-        )
-
-        response = {
-            "source": "base64 input",
-            "pages": results,
-        }
-
-    return JSONResponse(content=response)
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
 
 
 @app.post(
@@ -1584,6 +2199,8 @@ async def extract_text_url_json_tesseract(
     url = request.url
     language = request.language
     max_workers = request.max_workers
+    pages = request.pages
+    stream = request.stream
     eng_numbering = request.eng_numbering
     
     allowed_langs = {item.value for item in LanguageOCR}
@@ -1598,53 +2215,30 @@ async def extract_text_url_json_tesseract(
                 },
             )
         
-    try:
-        async with httpx.AsyncClient(
-            timeout=30.0
-        ) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Could not fetch file from URL: {response.reason_phrase}",
-                )
-            content = response.content
-    except httpx.RequestError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Request error: {e}",
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {e}",
-        )
-    
-    if not content.startswith(b"%PDF"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid PDF file",
-        )
-    
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
-
-        extractor = OCRExtractor(file_path=tmp.name)
-        results = extractor.extract_text(
+    async def respond():
+        document = await ingest_url(url)
+        return await run_in_threadpool(
+            _ocr_response,
+            source="url",
+            document=document,
             max_workers=max_workers,
-            lang=language,
+            language=language,
             eng_numbering=eng_numbering,
+            pages=pages,
+            stream=stream,
         )
 
-        response = {
-            "source": "url",
-            "pages": results,
-        }
-
-    return JSONResponse(response)
+    return await _coalesce(
+        f"url:{url}",
+        "extract_text_url_json_tesseract",
+        {
+            "language": language,
+            "eng_numbering": eng_numbering,
+            "pages": pages,
+        },
+        stream,
+        respond,
+    )
 
 
 @app.post(
@@ -1659,6 +2253,8 @@ async def extract_text_base64_json_tesseract(
     base64_pdf = request.base64_pdf
     language = request.language
     max_workers = request.max_workers
+    pages = request.pages
+    stream = request.stream
     eng_numbering = request.eng_numbering
 
     allowed_langs = {item.value for item in LanguageOCR}
@@ -1673,36 +2269,526 @@ async def extract_text_base64_json_tesseract(
                 },
             )
     
-    try:
-        content = base64.b64decode(base64_pdf)
-    except Exception as e:
+    document = await ingest_base64(base64_pdf)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_base64_json_tesseract",
+        {
+            "language": language,
+            "eng_numbering": eng_numbering,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _ocr_response,
+            source="base64 input",
+            document=document,
+            max_workers=max_workers,
+            language=language,
+            eng_numbering=eng_numbering,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
+
+
+@app.post(
+    path="/extract_text_raw_tesseract/",
+    tags=[
+        "Tesseract OCR",
+    ]
+)
+async def extract_text_raw_tesseract(
+    request: Request,
+    max_workers: int = 32,
+    eng_numbering: bool = False,
+    language: LanguageOCR = LanguageOCR.Farsi,
+    pages: str | None = None,
+    stream: bool = False,
+):
+    if request.headers.get("Content-Type", "").split(";")[0] != "application/pdf":
         raise HTTPException(
             status_code=400,
-            detail="Invalid PDF file",
+            detail="Invalid file type. Only PDF file allowed."
         )
 
-    if not content.startswith(b"%PDF"):
+    document = await ingest_request(request)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_raw_tesseract",
+        {
+            "language": language.value,
+            "eng_numbering": eng_numbering,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _ocr_response,
+            source="raw body",
+            document=document,
+            max_workers=max_workers,
+            language=language.value,
+            eng_numbering=eng_numbering,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
+
+
+@app.post(
+    path="/documents/",
+    tags=[
+        "Documents",
+    ]
+)
+async def upload_document(
+    file: UploadFile = File(...),
+):
+    if file.content_type != "application/pdf":
         raise HTTPException(
             status_code=400,
-            detail="Invalid PDF file",
+            detail="Invalid file type. Only PDF file allowed."
+        )
+
+    document = await ingest_upload(file, spool=True)
+
+    return JSONResponse(
+        status_code=200,
+        content=await run_in_threadpool(document_store.put, document),
+    )
+
+
+@app.get(
+    path="/documents/{document_id}/",
+    tags=[
+        "Documents",
+    ]
+)
+async def get_document(
+    document_id: str,
+):
+    info = document_store.info(document_id)
+    if info is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Unknown or expired document",
         )
+    return JSONResponse(
+        status_code=200,
+        content=info,
+    )
 
-    with tempfile.NamedTemporaryFile(
-        delete=True, suffix=".pdf",
-    ) as tmp:
-        tmp.write(content)
-        tmp.flush()
 
-        extractor = OCRExtractor(file_path=tmp.name)
-        results = extractor.extract_text(
+@app.delete(
+    path="/documents/{document_id}/",
+    tags=[
+        "Documents",
+    ]
+)
+async def delete_document(
+    document_id: str,
+):
+    match document_store.delete(document_id):
+        case None:
+            raise HTTPException(
+                status_code=404,
+                detail="Unknown or expired document",
+            )
+        case False:
+            raise HTTPException(
+                status_code=409,
+                detail="Document is in use, try again later",
+            )
+    return JSONResponse(
+        status_code=200,
+        content={
+            "document_id": document_id,
+            "deleted": True,
+        },
+    )
+
+
+@app.post(
+    path="/documents/{document_id}/extract_text_mu/",
+    tags=[
+        "Documents",
+        "PyMuPDF",
+    ]
+)
+async def extract_text_document_mu(
+    document_id: str,
+    max_workers: int = 32,
+    eng_numbering: bool = False,
+    ocr_mode : OCROption = OCROption.NoOcr,
+    ocr_language: LanguageOCR = LanguageOCR.Farsi,
+    pages: str | None = None,
+    stream: bool = False,
+):
+    document = _stored(document_id)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_document_mu",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": ocr_mode,
+            "ocr_language": ocr_language.value,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _text_response,
+            source="document store",
+            document=document,
+            extractor_class=MuExtractor,
             max_workers=max_workers,
-            lang=language,
             eng_numbering=eng_numbering,
-        )
+            ocr_mode=ocr_mode,
+            ocr_language=ocr_language.value,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
+
+
+@app.post(
+    path="/documents/{document_id}/extract_image_mu/",
+    tags=[
+        "Documents",
+        "PyMuPDF",
+    ]
+)
+async def extract_image_document_mu(
+    document_id: str,
+    max_workers: int = 32,
+    pages: str | None = None,
+    stream: bool = False,
+):
+    document = _stored(document_id)
+
+    return await _coalesce(
+        document.digest,
+        "extract_image_document_mu",
+        {
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _image_response,
+            source="document store",
+            document=document,
+            max_workers=max_workers,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
+
+
+@app.post(
+    path="/documents/{document_id}/extract_all_mu/",
+    tags=[
+        "Documents",
+        "PyMuPDF",
+    ]
+)
+async def extract_all_document_mu(
+    document_id: str,
+    max_workers: int = 32,
+    text: bool = True,
+    images: bool = True,
+    metadata: bool = True,
+    bounding_boxes: bool = True,
+    image_data: bool = True,
+    eng_numbering: bool = False,
+    pages: str | None = None,
+    stream: bool = False,
+):
+    document = _stored(document_id)
+
+    return await _coalesce(
+        document.digest,
+        "extract_all_document_mu",
+        {
+            "text": text,
+            "images": images,
+            "metadata": metadata,
+            "bounding_boxes": bounding_boxes,
+            "image_data": image_data,
+            "eng_numbering": eng_numbering,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _all_response,
+            source="document store",
+            document=document,
+            max_workers=max_workers,
+            text=text,
+            images=images,
+            metadata=metadata,
+            bounding_boxes=bounding_boxes,
+            image_data=image_data,
+            eng_numbering=eng_numbering,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
+
+
+@app.post(
+    path="/documents/{document_id}/extract_text_pypdf/",
+    tags=[
+        "Documents",
+        "PyPDF2",
+    ]
+)
+async def extract_text_document_pypdf(
+    document_id: str,
+    max_workers: int = 32,
+    eng_numbering: bool = False,
+    ocr_mode : OCROption = OCROption.NoOcr,
+    ocr_language: LanguageOCR = LanguageOCR.Farsi,
+    pages: str | None = None,
+    stream: bool = False,
+):
+    document = _stored(document_id)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_document_pypdf",
+        {
+            "eng_numbering": eng_numbering,
+            "ocr_mode": ocr_mode,
+            "ocr_language": ocr_language.value,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _text_response,
+            source="document store",
+            document=document,
+            extractor_class=PyPDFExtractor,
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            ocr_mode=ocr_mode,
+            ocr_language=ocr_language.value,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
+
+
+@app.post(
+    path="/documents/{document_id}/extract_text_tika/",
+    tags=[
+        "Documents",
+        "Apache Tika",
+    ]
+)
+async def extract_text_document_tika(
+    document_id: str,
+    eng_numbering: bool = False,
+):
+    document = _stored(document_id)
+
+    async def respond():
+        parsed_doc = await parse_document(document)
+
+        content = digits_to_latin(
+            parsed_doc.get("content")
+        ) if eng_numbering else parsed_doc.get("content")
 
         response = {
-            "source": "base64 input",
-            "pages": results,
+            "source": "document store",
+            "metadata": parsed_doc.get("metadata"),
+            "content": content,
+            "extractor": parsed_doc.get("extractor"),
         }
 
-    return JSONResponse(content=response)
+        return JSONResponse(content=response)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_document_tika",
+        {
+            "eng_numbering": eng_numbering,
+        },
+        False,
+        respond,
+        document,
+    )
+
+
+@app.post(
+    path="/documents/{document_id}/extract_text_tesseract/",
+    tags=[
+        "Documents",
+        "Tesseract OCR",
+    ]
+)
+async def extract_text_document_tesseract(
+    document_id: str,
+    max_workers: int = 32,
+    eng_numbering: bool = False,
+    language: LanguageOCR = LanguageOCR.Farsi,
+    pages: str | None = None,
+    stream: bool = False,
+):
+    document = _stored(document_id)
+
+    return await _coalesce(
+        document.digest,
+        "extract_text_document_tesseract",
+        {
+            "language": language.value,
+            "eng_numbering": eng_numbering,
+            "pages": pages,
+        },
+        stream,
+        partial(
+            run_in_threadpool,
+            _ocr_response,
+            source="document store",
+            document=document,
+            max_workers=max_workers,
+            language=language.value,
+            eng_numbering=eng_numbering,
+            pages=pages,
+            stream=stream,
+        ),
+        document,
+    )
+
+
+@app.post(
+    path="/jobs/",
+    tags=[
+        "Jobs",
+    ]
+)
+async def submit_job(
+    kind: JobKind = Form(...),
+    file: UploadFile | None = File(None),
+    url: str | None = Form(None),
+    base64_pdf: str | None = Form(None),
+    document_id: str | None = Form(None),
+    max_workers: int = Form(32),
+    eng_numbering: bool = Form(False),
+    ocr_mode : OCROption = Form(OCROption.NoOcr),
+    ocr_language: LanguageOCR = Form(LanguageOCR.Farsi),
+    pages: str | None = Form(None),
+    text: bool = Form(True),
+    images: bool = Form(True),
+    bounding_boxes: bool = Form(True),
+    image_data: bool = Form(True),
+    webhook_url: str | None = Form(None),
+):
+    sources = [
+        source for source in (file, url, base64_pdf, document_id)
+        if source is not None
+    ]
+    if len(sources) != 1:
+        raise HTTPException(
+            status_code=422,
+            detail="Exactly one of file, url, base64_pdf or document_id is required",
+        )
+
+    # The document goes to the store, where the job runners pick it up
+    if document_id is None:
+        if file is not None:
+            if file.content_type != "application/pdf":
+                raise HTTPException(
+                    status_code=400,
+                    detail="Invalid file type. Only PDF file allowed."
+                )
+            document = await ingest_upload(file, spool=True)
+        elif url is not None:
+            document = await ingest_url(url, spool=True)
+        else:
+            document = await ingest_base64(base64_pdf, spool=True)
+        info = await run_in_threadpool(document_store.put, document)
+        document_id = info["document_id"]
+
+    page_count = await run_in_threadpool(_job_page_count, document_id, pages)
+
+    job = await run_in_threadpool(
+        job_queue.submit,
+        kind=kind.value,
+        document_id=document_id,
+        options={
+            "max_workers": max_workers,
+            "eng_numbering": eng_numbering,
+            "ocr_mode": ocr_mode.value,
+            "ocr_language": ocr_language.value,
+            "pages": pages,
+            "text": text,
+            "images": images,
+            "bounding_boxes": bounding_boxes,
+            "image_data": image_data,
+        },
+        page_count=page_count,
+        webhook_url=webhook_url,
+    )
+    return JSONResponse(
+        status_code=202,
+        content=job,
+    )
+
+
+@app.get(
+    path="/jobs/{job_id}/",
+    tags=[
+        "Jobs",
+    ]
+)
+async def get_job(
+    job_id: str,
+):
+    return JSONResponse(
+        status_code=200,
+        content=await run_in_threadpool(_job, job_id),
+    )
+
+
+@app.get(
+    path="/jobs/{job_id}/results/",
+    tags=[
+        "Jobs",
+    ]
+)
+async def get_job_results(
+    job_id: str,
+    cursor: int = 0,
+    limit: int = 50,
+):
+    job = await run_in_threadpool(_job, job_id)
+    pages, next_cursor = await run_in_threadpool(
+        job_queue.pages,
+        job_id,
+        cursor,
+        max(1, min(limit, 500)),
+    )
+    return JSONResponse(
+        status_code=200,
+        content={
+            "job_id": job_id,
+            "status": job["status"],
+            "metadata": job["metadata"],
+            "pages": pages,
+            "next_cursor": next_cursor,
+        },
+    )
@@ -17,17 +17,29 @@ class OCROption(Enum):
     ForceOcr = "force_ocr"
 
 
+class JobKind(Enum):
+    TextMu = "text_mu"
+    TextPyPdf = "text_pypdf"
+    ImageMu = "image_mu"
+    AllMu = "all_mu"
+    Ocr = "ocr"
+
+
 class JsonRequestTextUrl(BaseModel):
     url: str
     max_workers: int = 32
     eng_numbering: bool = False
     ocr_mode: str = "no_ocr"
     ocr_language: str = "fas"
+    pages: str | None = None
+    stream: bool = False
 
 
 class JsonRequestImageUrl(BaseModel):
     url: str
     max_workers: int = 32
+    pages: str | None = None
+    stream: bool = False
 
 
 class JsonRequestTikaUrl(BaseModel):
@@ -40,6 +52,14 @@ class JsonRequestOcrUrl(BaseModel):
     language: str = "fas"
     max_workers: int = 32
     eng_numbering: bool = False
+    pages: str | None = None
+    stream: bool = False
+
+
+class JsonRequestTextBatchUrl(BaseModel):
+    urls: list[str]
+    max_workers: int = 32
+    eng_numbering: bool = False
 
 
 class JsonRequestTextBase64(BaseModel):
@@ -48,11 +68,15 @@ class JsonRequestTextBase64(BaseModel):
     eng_numbering: bool = False
     ocr_mode: str = "no_ocr"
     ocr_language: str = "fas"
+    pages: str | None = None
+    stream: bool = False
 
 
 class JsonRequestImageBase64(BaseModel):
     base64_pdf: str
     max_workers: int = 32
+    pages: str | None = None
+    stream: bool = False
 
 
 class JsonRequestTikaBase64(BaseModel):
@@ -65,3 +89,5 @@ class JsonRequestOcrBase64(BaseModel):
     language: str = "fas"
     max_workers: int = 32
     eng_numbering: bool = False
+    pages: str | None = None
+    stream: bool = False
@@ -0,0 +1,283 @@
+import os
+import fitz
+import httpx
+import asyncio
+from fastapi import HTTPException
+from .http_client import get_client
+from ..core.buffer import PdfFile
+from ..core.extractor import MuExtractor
+from ..core.admission import admission
+from .balancer import Balancer, Unavailable
+from fastapi.concurrency import run_in_threadpool
+
+
+# A comma separated list of Tika servers; requests go to the least busy one
+TIKA_URLS = [
+    url.strip()
+    for url in os.getenv("TIKA_URL", "http://localhost:9998").split(",")
+    if url.strip()
+]
+TIKA_URL = TIKA_URLS[0]
+# tika.parser's own default; a slow document is not a failed server
+TIKA_TIMEOUT = float(os.getenv("TIKA_TIMEOUT", 60))
+TIKA_FAILURE_THRESHOLD = int(os.getenv("TIKA_FAILURE_THRESHOLD", 3))
+TIKA_OPEN_SECONDS = float(os.getenv("TIKA_OPEN_SECONDS", 30))
+TIKA_HEALTH_INTERVAL = float(os.getenv("TIKA_HEALTH_INTERVAL", 10))
+# Extract PDFs with PyMuPDF when no Tika server can take the request
+TIKA_FALLBACK = os.getenv("TIKA_FALLBACK", "false").lower() == "true"
+TIKA_CHUNK_BYTES = int(os.getenv("TIKA_CHUNK_BYTES", 1024 * 1024))
+# PDFs with at least this many pages are sent to Tika in page ranges
+TIKA_SPLIT_MIN_PAGES = int(os.getenv("TIKA_SPLIT_MIN_PAGES", 40))
+TIKA_SPLIT_PAGES = int(os.getenv("TIKA_SPLIT_PAGES", 20))
+TIKA_PARALLEL_PARTS = int(os.getenv("TIKA_PARALLEL_PARTS", 4))
+
+
+tika_servers = Balancer(
+    TIKA_URLS,
+    failure_threshold=TIKA_FAILURE_THRESHOLD,
+    open_seconds=TIKA_OPEN_SECONDS,
+)
+
+
+def merge_rmeta(
+        documents: list[dict],
+) -> dict:
+    # Same shape as tika.parser.from_buffer: the text of every embedded
+    # document concatenated, their metadata merged into lists on clashes
+    parsed = {
+        "metadata": {},
+        "content": "".join(
+            js.get("X-TIKA:content", "") for js in documents
+        ) or None,
+    }
+    metadata = parsed["metadata"]
+    for js in documents:
+        for key, value in js.items():
+            if key == "X-TIKA:content":
+                continue
+            if key in metadata:
+                if not isinstance(metadata[key], list):
+                    metadata[key] = [metadata[key]]
+                metadata[key].append(value)
+            else:
+                metadata[key] = value
+    return parsed
+
+
+async def _read_chunks(
+        document: PdfFile,
+):
+    with document.open() as file:
+        while chunk := await run_in_threadpool(file.read, TIKA_CHUNK_BYTES):
+            yield chunk
+
+
+def _split_plan(
+        path: str,
+) -> tuple[int, dict] | None:
+    # Only PDFs long enough to be worth it are split; anything else,
+    # including encrypted files, goes to Tika in one piece
+    with open(path, "rb") as file:
+        if file.read(4) != b"%PDF":
+            return None
+    with fitz.open(path) as doc:
+        if doc.needs_pass or doc.page_count < TIKA_SPLIT_MIN_PAGES:
+            return None
+        return doc.page_count, doc.metadata
+
+
+def _split_part(
+        path: str,
+        metadata: dict,
+        start: int,
+        stop: int,
+) -> bytes:
+    with fitz.open(path) as doc, fitz.open() as part:
+        part.insert_pdf(doc, from_page=start, to_page=stop - 1)
+        part.set_metadata(metadata)
+        return part.tobytes()
+
+
+async def _put_rmeta(
+        content,
+        headers: dict,
+) -> list[dict]:
+    # content is a factory so the body can be sent again to another server
+    tried = set()
+    while True:
+        endpoint = tika_servers.acquire(exclude=tried)
+        tried.add(endpoint.url)
+        ok = None
+        try:
+            response = await get_client().put(
+                f"{endpoint.url}/rmeta/text",
+                content=content(),
+                headers={
+                    "Accept": "application/json",
+                    **headers,
+                },
+                timeout=TIKA_TIMEOUT,
+            )
+            ok = response.status_code < 500
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            # The request never reached the server; another one may take it
+            ok = False
+        except httpx.TimeoutException:
+            # The document is slow to parse, which another server would not
+            # change; it is not held against this one either
+            raise HTTPException(
+                status_code=504,
+                detail="Tika server timed out parsing the document",
+            )
+        except httpx.RequestError as e:
+            # Lost part-way through; sending it again could parse it twice
+            ok = False
+            raise HTTPException(
+                status_code=502,
+                detail=f"Tika request failed: {e}",
+            )
+        finally:
+            tika_servers.release(endpoint, ok)
+        if ok:
+            break
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=502,
+            detail=f"Tika server error: {response.status_code} {response.reason_phrase}",
+        )
+    return response.json()
+
+
+async def _parse_part(
+        path: str,
+        metadata: dict,
+        start: int,
+        stop: int,
+        limiter: asyncio.Semaphore,
+) -> list[dict]:
+    # The sub-PDF is only built once the part may be sent, so at most
+    # TIKA_PARALLEL_PARTS of them are held in memory
+    async with limiter:
+        content = await run_in_threadpool(_split_part, path, metadata, start, stop)
+        return await _put_rmeta(
+            lambda: content,
+            {
+                "Content-Type": "application/pdf",
+            },
+        )
+
+
+def merge_parts(
+        parts: list[list[dict]],
+        page_count: int,
+) -> dict:
+    # Each part's first entry describes the part itself; the first one
+    # stands for the whole document, embedded resources are kept from all
+    containers = [part[0] for part in parts]
+    embedded = [js for part in parts for js in part[1:]]
+    parsed = merge_rmeta([containers[0], *embedded])
+    parsed["content"] = "".join(
+        js.get("X-TIKA:content", "") for js in containers + embedded
+    ) or None
+    if "xmpTPg:NPages" in parsed["metadata"]:
+        parsed["metadata"]["xmpTPg:NPages"] = str(page_count)
+    return parsed
+
+
+async def _parse_tika(
+        document: PdfFile,
+) -> dict:
+    plan = await run_in_threadpool(_split_plan, document.path)
+    if plan is None:
+        parsed = merge_rmeta(
+            await _put_rmeta(
+                lambda: _read_chunks(document),
+                {
+                    "Content-Length": str(document.size),
+                },
+            )
+        )
+    else:
+        # Tika parses one document on one thread; page ranges sent as
+        # separate requests are parsed side by side and merged in order
+        page_count, metadata = plan
+        limiter = asyncio.Semaphore(TIKA_PARALLEL_PARTS)
+        tasks = [
+            asyncio.ensure_future(
+                _parse_part(
+                    document.path,
+                    metadata,
+                    start,
+                    min(start + TIKA_SPLIT_PAGES, page_count),
+                    limiter,
+                )
+            )
+            for start in range(0, page_count, TIKA_SPLIT_PAGES)
+        ]
+        try:
+            parts = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        parsed = merge_parts(parts, page_count)
+    parsed["status"] = 200
+    parsed["extractor"] = "tika"
+    return parsed
+
+
+def _is_pdf(
+        path: str,
+) -> bool:
+    with open(path, "rb") as file:
+        return file.read(4) == b"%PDF"
+
+
+def _fallback(
+        document: PdfFile,
+) -> dict:
+    with admission.ticket(), MuExtractor(content=document) as extractor:
+        pages = extractor.extract_text(
+            eng_numbering=False,
+        )
+        return {
+            "metadata": extractor.get_metadata(),
+            "content": "\n".join(page["text"] for page in pages) or None,
+            "status": 200,
+            "extractor": "MuExtractor",
+        }
+
+
+async def parse_document(
+        document: PdfFile,
+) -> dict:
+    with document:
+        try:
+            return await _parse_tika(document)
+        except Unavailable as e:
+            if TIKA_FALLBACK and await run_in_threadpool(_is_pdf, document.path):
+                return await run_in_threadpool(_fallback, document)
+            raise HTTPException(
+                status_code=503,
+                detail=str(e),
+            )
+
+
+async def monitor_servers():
+    # Health based ejection: a server failing its probe is taken out of
+    # rotation and comes back once a probe succeeds again
+    while True:
+        for endpoint in tika_servers.endpoints:
+            try:
+                response = await get_client().get(
+                    f"{endpoint.url}/tika",
+                    timeout=5.0,
+                )
+                healthy = response.status_code == 200
+            except httpx.RequestError:
+                healthy = False
+            if healthy:
+                tika_servers.mark_up(endpoint)
+            else:
+                tika_servers.mark_down(endpoint)
+        await asyncio.sleep(TIKA_HEALTH_INTERVAL)
@@ -0,0 +1,159 @@
+import os
+import time
+import fcntl
+import random
+from .pool import CPU_LIMIT
+from .cancel import Cancellation
+
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_DIR = os.getenv("ADMISSION_DIR", "/tmp/pdf-extractor-admission")
+ADMISSION_SLOTS = int(os.getenv("ADMISSION_SLOTS", CPU_LIMIT))
+ADMISSION_QUEUE_DEPTH = int(os.getenv("ADMISSION_QUEUE_DEPTH", 64))
+ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", 60))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 5))
+
+
+class Overloaded(Exception):
+
+    def __init__(
+            self,
+            message: str,
+            retry_after: int = ADMISSION_RETRY_AFTER,
+    ):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Lease:
+    # An flock held on one of the lock files; the kernel drops it if the
+    # holding process dies, so a crashed worker never leaks capacity
+
+    def __init__(
+            self,
+            fd: int | None,
+    ):
+        self._fd = fd
+
+    def release(
+            self,
+    ):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(
+            self,
+    ):
+        return self
+
+    def __exit__(
+            self,
+            *exc_info,
+    ):
+        self.release()
+
+
+class AdmissionController:
+    # Host-wide limits shared by every uvicorn worker through lock files:
+    # "slots" bound the page tasks running at once, "tickets" bound the
+    # requests in the system (running or queued for a slot)
+
+    def __init__(
+            self,
+            slots: int = ADMISSION_SLOTS,
+            queue_depth: int = ADMISSION_QUEUE_DEPTH,
+            lock_dir: str = ADMISSION_DIR,
+            timeout: float = ADMISSION_TIMEOUT,
+            enabled: bool = ADMISSION_ENABLED,
+    ):
+        self.enabled = enabled
+        self.slots = slots
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self._slot_paths = [
+            os.path.join(lock_dir, f"slot-{i}.lock") for i in range(slots)
+        ]
+        self._ticket_paths = [
+            os.path.join(lock_dir, f"ticket-{i}.lock")
+            for i in range(slots + queue_depth)
+        ]
+        if self.enabled:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    @staticmethod
+    def _try_lock(
+            paths: list[str],
+    ) -> int | None:
+        offset = random.randrange(len(paths))
+        for path in paths[offset:] + paths[:offset]:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def ticket(
+            self,
+    ) -> Lease:
+        if not self.enabled:
+            return Lease(None)
+        fd = self._try_lock(self._ticket_paths)
+        if fd is None:
+            raise Overloaded("Too many extraction requests in progress")
+        return Lease(fd)
+
+    def acquire_slot(
+            self,
+            cancellation: Cancellation | None = None,
+    ) -> Lease:
+        if not self.enabled:
+            return Lease(None)
+        deadline = time.monotonic() + self.timeout
+        delay = 0.001
+        while True:
+            fd = self._try_lock(self._slot_paths)
+            if fd is not None:
+                return Lease(fd)
+            # A request whose client is gone stops queueing for a slot
+            if cancellation is not None:
+                cancellation.check()
+            if time.monotonic() >= deadline:
+                raise Overloaded("Timed out waiting for an extraction slot")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.02)
+
+    def _count_held(
+            self,
+            paths: list[str],
+    ) -> int:
+        held = 0
+        for path in paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            except BlockingIOError:
+                held += 1
+            finally:
+                os.close(fd)
+        return held
+
+    def stats(
+            self,
+    ) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "slots": self.slots,
+            "slots_in_use": self._count_held(self._slot_paths),
+            "tickets": len(self._ticket_paths),
+            "tickets_in_use": self._count_held(self._ticket_paths),
+        }
+
+
+admission = AdmissionController()
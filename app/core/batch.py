@@ -0,0 +1,293 @@
+import os
+import math
+import time
+from typing import Callable, Iterator
+from .pool import (
+    PAGE_TIMEOUT_SECONDS,
+    TASKS_PER_WORKER,
+    TaskTimeout,
+    timed_call,
+    page_costs,
+    plan_workers,
+)
+from .buffer import PdfBuffer, PdfFile
+from .admission import admission
+from .cancel import Cancelled, current_cancellation
+from .extractor import TEXT_BATCH_PAGES, MuExtractor, submit_admitted
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from collections import deque
+
+
+# Most pages one pool task takes, whichever documents they come from
+BATCH_TASK_PAGES = int(os.getenv("BATCH_TASK_PAGES", 64))
+
+
+def _extract_parts(
+        parts: list[tuple],
+) -> list[tuple[int, list[dict] | None, str | None]]:
+    # One task covers pages of several small documents, so a batch of
+    # one page PDFs does not pay a pool round trip per document; a broken
+    # document only fails its own part
+    results = []
+    for index, source, pages in parts:
+        try:
+            results.append(
+                (
+                    index,
+                    MuExtractor._extract_text((source, pages, False, None, False)),
+                    None,
+                )
+            )
+        except Cancelled:
+            raise
+        except Exception as e:
+            results.append((index, None, str(e) or type(e).__name__))
+    return results
+
+
+def pack_parts(
+        parts: list[tuple],
+        task_pages: int,
+) -> list[list[tuple]]:
+    # Long documents are cut into pieces of task_pages pages, short ones
+    # are packed together until a task is full
+    tasks = []
+    current = []
+    size = 0
+    for index, source, pages in parts:
+        for start in range(0, len(pages), task_pages):
+            chunk = pages[start:start + task_pages]
+            if current and size + len(chunk) > task_pages:
+                tasks.append(current)
+                current = []
+                size = 0
+            current.append((index, source, chunk))
+            size += len(chunk)
+    if current:
+        tasks.append(current)
+    return tasks
+
+
+def _admit(
+        pending: dict[int, dict],
+        index: int,
+        document: PdfBuffer | PdfFile | str,
+        eng_numbering: bool,
+) -> tuple[dict | None, tuple | None]:
+    # Either the document's result right away, or the part of it that
+    # still needs extracting
+    if isinstance(document, str):
+        return {"error": document}, None
+    try:
+        extractor = MuExtractor(content=document)
+    except Exception as e:
+        return {"error": str(e) or type(e).__name__}, None
+    state = {
+        "extractor": extractor,
+        "pages": [],
+        "keys": {},
+        "remaining": 0,
+    }
+    missing = []
+    for pg_num in range(extractor.page_count):
+        key = extractor._page_key(pg_num, backend=MuExtractor.__name__)
+        pg_txt = extractor._cache_get(key)
+        if pg_txt is None:
+            state["keys"][pg_num] = key
+            missing.append(pg_num)
+        else:
+            state["pages"].append(
+                extractor._page(pg_num, pg_txt, eng_numbering)
+            )
+    if not missing:
+        return _result(state), None
+    state["remaining"] = len(missing)
+    pending[index] = state
+    return None, (index, extractor.source, missing)
+
+
+def _task_pages(
+        task: list[tuple],
+) -> int:
+    return sum(len(part[2]) for part in task)
+
+
+def iter_batch_text(
+        next_document: Callable[[], Future],
+        max_workers: int,
+        eng_numbering: bool,
+) -> Iterator[tuple[int, dict]]:
+    # next_document() gives a Future of the next (index, document) to
+    # arrive, a str in place of a document that could not be had, or of
+    # None after the last one. Pages go out while later documents are
+    # still arriving, and the pages of every document share the same pool
+    # tasks. Yields (index, result) for each document as soon as its last
+    # page is in
+    cancellation = current_cancellation.get()
+    cancel_path = cancellation.path if cancellation is not None else None
+    deadline = cancellation.deadline if cancellation is not None else None
+    pending = {}
+    # Pages of arrived documents not packed into a task yet
+    parts = []
+    part_pages = 0
+    queued = deque()
+    futures = {}
+    # Nothing can stop a page running inline, so while a timeout applies
+    # every task goes to a worker that can be killed; and once on the pool
+    # a batch stays there, so the pages of a task that failed there are
+    # never retried inline
+    pooled = PAGE_TIMEOUT_SECONDS > 0 or deadline is not None
+    arrival = next_document()
+    try:
+        while True:
+            while arrival is not None and arrival.done():
+                item = arrival.result()
+                if item is None:
+                    arrival = None
+                    break
+                arrival = next_document()
+                index, document = item
+                result, part = _admit(pending, index, document, eng_numbering)
+                if result is not None:
+                    yield index, result
+                if part is not None:
+                    parts.append(part)
+                    part_pages += len(part[2])
+
+            page_count = part_pages + sum(
+                _task_pages(task)
+                for task in (*queued, *futures.values())
+            )
+            workers = plan_workers(
+                page_count=page_count,
+                kind="text",
+                max_workers=max_workers,
+            )
+            if workers == 0 and (
+                pooled or arrival is not None and part_pages >= BATCH_TASK_PAGES
+            ):
+                # More than fits inline is on its way
+                workers = 1
+            # Pack what has arrived once it fills a task, once nothing more
+            # is coming, or as soon as a worker would otherwise sit idle;
+            # inline work waits for the whole batch
+            if parts and (
+                arrival is None
+                or part_pages >= BATCH_TASK_PAGES
+                or len(futures) + len(queued) < workers
+            ):
+                task_pages = min(
+                    BATCH_TASK_PAGES,
+                    max(
+                        TEXT_BATCH_PAGES,
+                        math.ceil(page_count / (max(1, workers) * TASKS_PER_WORKER)),
+                    ),
+                )
+                queued.extend(pack_parts(parts, task_pages))
+                parts = []
+                part_pages = 0
+
+            while len(futures) < max(1, workers) and queued:
+                task = queued.popleft()
+                if deadline is not None and time.time() >= deadline:
+                    yield from _collect(pending, _timed_out(task), eng_numbering)
+                    continue
+                if workers == 0:
+                    with admission.acquire_slot(cancellation):
+                        seconds, results = timed_call(_extract_parts, task, cancel_path)
+                    page_costs.observe("text", seconds, _task_pages(task))
+                    yield from _collect(pending, results, eng_numbering)
+                    continue
+                futures[submit_admitted(_extract_parts, task, cancellation)] = task
+                pooled = True
+
+            if not futures and arrival is None:
+                break
+            waiting = list(futures)
+            if arrival is not None:
+                waiting.append(arrival)
+            if cancellation is not None:
+                waiting.append(cancellation.future)
+            done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+            if cancellation is not None:
+                cancellation.check()
+            for future in done:
+                task = futures.pop(future, None)
+                if task is None:
+                    # The next document is in
+                    continue
+                try:
+                    seconds, results = future.result()
+                except TaskTimeout:
+                    in_time = deadline is None or time.time() < deadline
+                    if _task_pages(task) > 1 and in_time:
+                        # One page per task this time, to find the one that hangs
+                        queued.extendleft(
+                            [(index, source, [pg_num])]
+                            for index, source, pages in reversed(task)
+                            for pg_num in reversed(pages)
+                        )
+                    else:
+                        yield from _collect(pending, _timed_out(task), eng_numbering)
+                    continue
+                page_costs.observe("text", seconds, _task_pages(task))
+                yield from _collect(pending, results, eng_numbering)
+    finally:
+        for future in futures:
+            future.cancel()
+        if arrival is not None:
+            arrival.cancel()
+
+
+def _timed_out(
+        task: list[tuple],
+) -> list[tuple[int, list[dict], None]]:
+    return [
+        (
+            index,
+            [{"page_number": pg_num + 1, "timed_out": True} for pg_num in pages],
+            None,
+        )
+        for index, _, pages in task
+    ]
+
+
+def _collect(
+        pending: dict[int, dict],
+        results: list[tuple[int, list[dict] | None, str | None]],
+        eng_numbering: bool,
+) -> Iterator[tuple[int, dict]]:
+    for index, pages, error in results:
+        state = pending.get(index)
+        if state is None:
+            # An earlier part of this document already failed it
+            continue
+        if error is not None:
+            del pending[index]
+            yield index, {"error": error}
+            continue
+        extractor = state["extractor"]
+        for page in pages:
+            pg_num = page["page_number"] - 1
+            if page.get("timed_out"):
+                state["pages"].append(extractor._page(pg_num, None, eng_numbering))
+                continue
+            extractor._cache_set(state["keys"][pg_num], page["text"])
+            state["pages"].append(
+                extractor._page(pg_num, page["text"], eng_numbering)
+            )
+        state["remaining"] -= len(pages)
+        if state["remaining"] == 0:
+            del pending[index]
+            yield index, _result(state)
+
+
+def _result(
+        state: dict,
+) -> dict:
+    extractor = state["extractor"]
+    return {
+        "metadata": extractor.get_metadata(),
+        "page_count": extractor.page_count,
+        "pages": extractor._sorted(state["pages"]),
+    }
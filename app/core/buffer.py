@@ -0,0 +1,323 @@
+import io
+import os
+import fitz
+import shutil
+import hashlib
+import threading
+from PyPDF2 import PdfReader
+from collections import OrderedDict
+from contextlib import contextmanager
+from .cache import content_digest
+from typing import Iterator, NamedTuple
+from multiprocessing import shared_memory
+
+
+# Parsed documents kept open per process for files in warm_directories
+WARM_DOCUMENTS = int(os.getenv("WARM_DOCUMENTS", 8))
+SHM_DIR = os.getenv("SHM_DIR", "/dev/shm")
+# Larger documents are spooled to disk instead of shared memory
+SHM_MAX_DOCUMENT_BYTES = int(os.getenv("SHM_MAX_DOCUMENT_BYTES", 64 * 1024 * 1024))
+# Shared memory left free for everything else using it
+SHM_RESERVE_BYTES = int(os.getenv("SHM_RESERVE_BYTES", 32 * 1024 * 1024))
+
+warm_directories: set[str] = set()
+
+_warm: OrderedDict[tuple, tuple[fitz.Document, threading.Lock]] = OrderedDict()
+_warm_lock = threading.Lock()
+
+
+def _reset_warm():
+    # A forked pool worker starts with its own, empty set
+    global _warm, _warm_lock
+    _warm = OrderedDict()
+    _warm_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_warm)
+
+
+class SharedPdf(NamedTuple):
+    name: str
+    size: int
+
+
+def shm_fits(
+        size: int,
+) -> bool:
+    if size > SHM_MAX_DOCUMENT_BYTES:
+        return False
+    try:
+        free = shutil.disk_usage(SHM_DIR).free
+    except OSError:
+        return True
+    return size + SHM_RESERVE_BYTES <= free
+
+
+class PdfBuffer:
+
+    def __init__(
+            self,
+            content: bytes | memoryview | None = None,
+            size: int | None = None,
+    ):
+        # Without content the segment is allocated empty and filled with write()
+        self.size = len(content) if content is not None else size
+        self._shm = shared_memory.SharedMemory(
+            create=True,
+            size=max(self.size, 1),
+        )
+        try:
+            # The segment is sparse; a write past what the tmpfs can hold
+            # would kill the process with SIGBUS, so the pages are claimed
+            # now and a full /dev/shm is an OSError here instead
+            os.posix_fallocate(self._shm._fd, 0, max(self.size, 1))
+        except OSError:
+            self._shm.close()
+            self._shm.unlink()
+            raise
+        if content is not None:
+            self._shm.buf[:self.size] = content
+        self._digest = None
+
+    @property
+    def source(
+            self,
+    ) -> SharedPdf:
+        return SharedPdf(self._shm.name, self.size)
+
+    @property
+    def digest(
+            self,
+    ) -> str:
+        if self._digest is None:
+            self._digest = content_digest(self._shm.buf[:self.size])
+        return self._digest
+
+    @digest.setter
+    def digest(
+            self,
+            value: str,
+    ):
+        self._digest = value
+
+    def write(
+            self,
+            offset: int,
+            chunk: bytes | memoryview,
+    ):
+        self._shm.buf[offset:offset + len(chunk)] = chunk
+
+    def close(
+            self,
+    ):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(
+            self,
+    ):
+        return self
+
+    def __exit__(
+            self,
+            *exc_info,
+    ):
+        self.close()
+
+
+class PdfFile:
+
+    def __init__(
+            self,
+            path: str,
+            size: int = 0,
+    ):
+        # A document spooled to disk; workers open it by path, and it is
+        # deleted on close like a PdfBuffer is unlinked
+        self.path = path
+        self.size = size
+        self._digest = None
+
+    @property
+    def source(
+            self,
+    ) -> str:
+        return self.path
+
+    @property
+    def digest(
+            self,
+    ) -> str:
+        if self._digest is None:
+            with open(self.path, "rb") as file:
+                self._digest = hashlib.file_digest(file, "sha256").hexdigest()
+        return self._digest
+
+    @digest.setter
+    def digest(
+            self,
+            value: str,
+    ):
+        self._digest = value
+
+    def open(
+            self,
+    ):
+        return open(self.path, "rb")
+
+    def close(
+            self,
+    ):
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __enter__(
+            self,
+    ):
+        return self
+
+    def __exit__(
+            self,
+            *exc_info,
+    ):
+        self.close()
+
+
+class _MappedFile(io.RawIOBase):
+    # A read-only file over a mapped buffer, for readers that want a file
+
+    def __init__(
+            self,
+            view: memoryview,
+    ):
+        self._view = view
+        self._pos = 0
+
+    def readable(
+            self,
+    ) -> bool:
+        return True
+
+    def seekable(
+            self,
+    ) -> bool:
+        return True
+
+    def readinto(
+            self,
+            buffer,
+    ) -> int:
+        count = max(0, min(len(buffer), len(self._view) - self._pos))
+        buffer[:count] = self._view[self._pos:self._pos + count]
+        self._pos += count
+        return count
+
+    def seek(
+            self,
+            offset: int,
+            whence: int = io.SEEK_SET,
+    ) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(
+            self,
+    ) -> int:
+        return self._pos
+
+
+@contextmanager
+def mapped_source(
+        source: str | SharedPdf,
+) -> Iterator[str | memoryview]:
+    # A shared buffer is read in place rather than copied out for every
+    # task; whatever is opened on it must be closed before the block ends
+    if not isinstance(source, SharedPdf):
+        yield source
+        return
+    shm = shared_memory.SharedMemory(name=source.name)
+    view = shm.buf[:source.size]
+    try:
+        yield view
+    finally:
+        view.release()
+        shm.close()
+
+
+def open_document(
+        data: str | memoryview,
+) -> fitz.Document:
+    if isinstance(data, str):
+        return fitz.open(data)
+    return fitz.open(stream=data, filetype="pdf")
+
+
+def open_reader(
+        data: str | memoryview,
+) -> PdfReader:
+    if isinstance(data, str):
+        return PdfReader(data)
+    return PdfReader(io.BufferedReader(_MappedFile(data)))
+
+
+def _evict_warm():
+    # Oldest first, skipping documents another thread is reading
+    for key in list(_warm):
+        if len(_warm) <= WARM_DOCUMENTS:
+            break
+        doc, lock = _warm[key]
+        if lock.acquire(blocking=False):
+            try:
+                doc.close()
+            finally:
+                lock.release()
+            del _warm[key]
+
+
+@contextmanager
+def source_document(
+        source: str | SharedPdf,
+) -> Iterator[fitz.Document]:
+    # A long-lived file (the document store) stays parsed for the next task
+    # that names it; per-request buffers and spooled uploads are opened anew
+    if (
+        not isinstance(source, str)
+        or WARM_DOCUMENTS <= 0
+        or os.path.dirname(os.path.abspath(source)) not in warm_directories
+    ):
+        with mapped_source(source) as data, open_document(data) as doc:
+            yield doc
+        return
+
+    stat = os.stat(source)
+    key = (source, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _warm_lock:
+        entry = _warm.get(key)
+        if entry is not None:
+            _warm.move_to_end(key)
+    if entry is None:
+        doc = open_document(source)
+        with _warm_lock:
+            entry = _warm.setdefault(key, (doc, threading.Lock()))
+            if entry[0] is not doc:
+                doc.close()
+            _evict_warm()
+
+    doc, lock = entry
+    with lock:
+        if not doc.is_closed:
+            yield doc
+            return
+    # Evicted between the lookup and the lock
+    with open_document(source) as doc:
+        yield doc
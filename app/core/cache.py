@@ -0,0 +1,234 @@
+import os
+import json
+import fcntl
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_MEMORY_BYTES = int(os.getenv("CACHE_MEMORY_BYTES", 256 * 1024**2))
+CACHE_DISK_BYTES = int(os.getenv("CACHE_DISK_BYTES", 2 * 1024**3))
+CACHE_DIR = os.getenv("CACHE_DIR", "/tmp/pdf-extractor-cache")
+
+
+def content_digest(
+        content: bytes | memoryview,
+) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class ResultCache:
+
+    def __init__(
+            self,
+            memory_bytes: int = CACHE_MEMORY_BYTES,
+            disk_bytes: int = CACHE_DISK_BYTES,
+            disk_dir: str = CACHE_DIR,
+            enabled: bool = CACHE_ENABLED,
+    ):
+        self.enabled = enabled
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.disk_dir = disk_dir
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        # The directory's total is kept in a file every process updates
+        # under an flock, so the cap holds across uvicorn workers
+        self._size_path = os.path.join(disk_dir, ".size")
+        self._evict_path = os.path.join(disk_dir, ".evict")
+        if self.enabled and self.disk_bytes > 0:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_size = self._update_disk_size(
+                total=sum(size for _, _, size in self._scan_disk()),
+            )
+
+    @staticmethod
+    def make_key(
+            digest: str,
+            **options,
+    ) -> str:
+        options = json.dumps(options, sort_keys=True)
+        return hashlib.sha256(f"{digest}:{options}".encode()).hexdigest()
+
+    def _disk_path(
+            self,
+            key: str,
+    ) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _scan_disk(
+            self,
+    ) -> list[tuple[float, str, int]]:
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def _remember(
+            self,
+            key: str,
+            data: bytes,
+    ):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_size -= len(old)
+            self._memory[key] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+                self.counters["memory_evictions"] += 1
+
+    def _update_disk_size(
+            self,
+            delta: int = 0,
+            total: int | None = None,
+    ) -> int:
+        fd = os.open(self._size_path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if total is None:
+                try:
+                    total = int(os.read(fd, 32) or 0) + delta
+                except ValueError:
+                    total = delta
+            total = max(0, total)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, str(total).encode())
+            return total
+        finally:
+            os.close(fd)
+
+    def _evict_disk(
+            self,
+    ):
+        # Other uvicorn workers share the directory, so eviction works from
+        # what is actually on disk; mtime doubles as the last access time.
+        # One process evicts at a time, the others carry on
+        fd = os.open(self._evict_path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            entries = sorted(self._scan_disk())
+            total = sum(size for _, _, size in entries)
+            target = self.disk_bytes * 0.9
+            for _, path, size in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.counters["disk_evictions"] += 1
+            self._disk_size = self._update_disk_size(total=total)
+        finally:
+            os.close(fd)
+
+    def get(
+            self,
+            key: str,
+    ):
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return json.loads(data)
+
+        if self.disk_bytes > 0:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as file:
+                    data = file.read()
+                os.utime(path)
+            except FileNotFoundError:
+                data = None
+            if data is not None:
+                self.counters["disk_hits"] += 1
+                self._remember(key, data)
+                return json.loads(data)
+
+        self.counters["misses"] += 1
+        return None
+
+    def set(
+            self,
+            key: str,
+            value,
+    ):
+        if not self.enabled:
+            return
+
+        data = json.dumps(value).encode("utf-8")
+        self._remember(key, data)
+
+        if self.disk_bytes <= 0 or len(data) > self.disk_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            self._disk_size = self._update_disk_size(len(data) - replaced)
+        except OSError:
+            # The disk tier is best effort; the memory tier already has it
+            return
+        if self._disk_size > self.disk_bytes:
+            self._evict_disk()
+
+    def stats(
+            self,
+    ) -> dict:
+        lookups = (
+            self.counters["memory_hits"]
+            + self.counters["disk_hits"]
+            + self.counters["misses"]
+        )
+        hits = lookups - self.counters["misses"]
+        return {
+            "enabled": self.enabled,
+            **self.counters,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "memory_limit_bytes": self.memory_bytes,
+            "disk_bytes": self._disk_size,
+            "disk_limit_bytes": self.disk_bytes,
+        }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,123 @@
+import os
+import time
+import uuid
+import threading
+from contextvars import ContextVar
+from concurrent.futures import Future
+
+
+CANCEL_DIR = os.getenv("CANCEL_DIR", "/tmp/pdf-extractor-cancel")
+# How often a running task looks for its cancel marker
+CANCEL_CHECK_SECONDS = float(os.getenv("CANCEL_CHECK_SECONDS", 0.05))
+# Markers outlive the request so tasks still running can find them
+CANCEL_KEEP_SECONDS = float(os.getenv("CANCEL_KEEP_SECONDS", 600))
+# Pages still missing this long after a request arrived are given up
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", 300))
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Cancellation:
+    # One per request. Threads of the API process wait on `future`, pool
+    # workers cannot see it and look for a marker file named after it.
+    # The request's deadline travels with it, as a time.time() value
+
+    def __init__(
+            self,
+            timeout: float = REQUEST_TIMEOUT_SECONDS,
+    ):
+        self.future = Future()
+        self.path = os.path.join(CANCEL_DIR, uuid.uuid4().hex)
+        self.deadline = time.time() + timeout if timeout > 0 else None
+
+    @property
+    def cancelled(
+            self,
+    ) -> bool:
+        return self.future.done()
+
+    def cancel(
+            self,
+    ):
+        if self.future.done():
+            return
+        try:
+            os.makedirs(CANCEL_DIR, exist_ok=True)
+            open(self.path, "w").close()
+            _sweep_markers()
+        except OSError:
+            # Running tasks then only stop when their result is dropped
+            pass
+        self.future.set_result(None)
+
+    def check(
+            self,
+    ):
+        if self.cancelled:
+            raise Cancelled("The client went away")
+
+
+def _sweep_markers():
+    expired_before = time.time() - CANCEL_KEEP_SECONDS
+    for name in os.listdir(CANCEL_DIR):
+        path = os.path.join(CANCEL_DIR, name)
+        try:
+            if os.stat(path).st_mtime < expired_before:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+current_cancellation: ContextVar[Cancellation | None] = ContextVar(
+    "current_cancellation",
+    default=None,
+)
+
+_task = threading.local()
+
+
+def start_task(
+        cancel_path: str | None,
+        progress_path: str | None = None,
+):
+    # progress_path is where the pool's watchdog learns when the task's
+    # current page started
+    _task.path = cancel_path
+    _task.cancelled = False
+    _task.checked_at = 0.0
+    _task.progress_path = progress_path
+    if progress_path is not None:
+        open(progress_path, "w").close()
+
+
+def end_task():
+    progress_path = getattr(_task, "progress_path", None)
+    start_task(None)
+    if progress_path is not None:
+        try:
+            os.unlink(progress_path)
+        except FileNotFoundError:
+            pass
+
+
+def task_cancelled() -> bool:
+    # Called from inside a task, between pages and from the OCR engine
+    path = getattr(_task, "path", None)
+    if path is None:
+        return False
+    now = time.monotonic()
+    if not _task.cancelled and now - _task.checked_at >= CANCEL_CHECK_SECONDS:
+        _task.checked_at = now
+        _task.cancelled = os.path.exists(path)
+    return _task.cancelled
+
+
+def check_task():
+    # Called as each page starts
+    if task_cancelled():
+        raise Cancelled("The client went away")
+    progress_path = getattr(_task, "progress_path", None)
+    if progress_path is not None:
+        os.utime(progress_path)
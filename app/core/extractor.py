@@ -1,292 +1,834 @@
-import fitz
+import time
 import base64
-import pytesseract
+from .pool import (
+    PAGE_TIMEOUT_SECONDS,
+    TaskTimeout,
+    submit,
+    timed_call,
+    page_costs,
+    page_batches,
+    plan_workers,
+)
 from .utils import (
     digits_to_latin,
     normalize_digits_and_fix_order,
 )
-from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
-from concurrent.futures import ProcessPoolExecutor
+from .buffer import (
+    PdfFile,
+    PdfBuffer,
+    SharedPdf,
+    open_reader,
+    mapped_source,
+    open_document,
+    source_document,
+)
+from .cache import result_cache
+from .admission import admission
+from .cancel import Cancellation, check_task, current_cancellation
+from .scheduler import page_weights, weighted_batches
+from .ocr import OCR_DPI, OCR_COLORSPACE, ocr_backend, ocr_page
+from concurrent.futures import FIRST_COMPLETED, wait
+from collections import deque
+
+
+TEXT_BATCH_PAGES = 8
+IMAGE_BATCH_PAGES = 2
+OCR_BATCH_PAGES = 1
+
+
+def submit_admitted(
+        fn,
+        args,
+        cancellation: Cancellation | None = None,
+):
+    # Every running task holds one host-wide admission slot
+    slot = admission.acquire_slot(cancellation)
+    try:
+        if cancellation is None:
+            future = submit(fn, args)
+        else:
+            future = submit(fn, args, cancellation.path, cancellation.deadline)
+    except Exception:
+        slot.release()
+        raise
+    future.add_done_callback(lambda _, slot=slot: slot.release())
+    return future
 
 
-class MuExtractor:
+class BaseExtractor:
 
     def __init__(
             self,
-            file_path: str,
+            file_path: str | None = None,
+            content: bytes | memoryview | PdfBuffer | PdfFile | None = None,
+            digest: str | None = None,
     ):
-        self.file_path = file_path
-        with fitz.open(file_path) as doc:
-            self.page_count = len(doc)
+        self.buffer = None
+        if isinstance(content, (PdfBuffer, PdfFile)):
+            self.source: str | SharedPdf = content.source
+            digest = digest or content.digest
+        elif content is not None:
+            self.buffer = PdfBuffer(content)
+            self.source = self.buffer.source
+            digest = digest or self.buffer.digest
+        elif file_path is not None:
+            self.source = file_path
+        else:
+            raise ValueError("Either file_path or content must be given")
+        # Page results are only cached when the document has a known digest
+        self.digest = digest
+        # Set by the API for the request this extractor works for
+        self.cancellation = current_cancellation.get()
+
+    def _selected(
+            self,
+            pages: list[int] | None,
+    ) -> list[int]:
+        if pages is None:
+            return list(range(self.page_count))
+        return [pg_num for pg_num in pages if 0 <= pg_num < self.page_count]
+
+    def _page_key(
+            self,
+            pg_num: int,
+            **options,
+    ) -> str | None:
+        if self.digest is None:
+            return None
+        return result_cache.make_key(self.digest, page=pg_num, **options)
+
+    def _ocr_key(
+            self,
+            pg_num: int,
+            lang: str,
+            dpi: int,
+            colorspace: str,
+    ) -> str | None:
+        return self._page_key(
+            pg_num,
+            backend="ocr",
+            engine=ocr_backend(),
+            lang=lang,
+            dpi=dpi,
+            colorspace=colorspace,
+        )
 
     @staticmethod
-    def _extract_text(
-            args,
-    ) -> dict:
-        file_path, pg_num, try_ocr, lang, eng_numbering = args
-        with fitz.open(file_path) as doc:
-            pg_txt = doc.get_page_text(pg_num)
-            pg_txt = normalize_digits_and_fix_order(
-                text=pg_txt,
-                eng_numbering=eng_numbering
-            )
-            if try_ocr and not pg_txt:
-                page = convert_from_path(
-                    file_path,
-                    first_page=pg_num+1,
-                    last_page=pg_num+1,
+    def _cache_get(
+            key: str | None,
+    ):
+        return None if key is None else result_cache.get(key)
+
+    @staticmethod
+    def _cache_set(
+            key: str | None,
+            value,
+    ):
+        if key is not None:
+            result_cache.set(key, value)
+
+    def _run(
+            self,
+            fn,
+            pages: list[int],
+            task_args: tuple,
+            min_batch_size: int,
+            max_workers: int,
+            kind: str,
+            empty: dict | None = None,
+    ):
+        # Pages that run out of time come out as `empty` with a timed_out flag
+        if not pages:
+            return
+        # max_workers is only an upper bound; the actual fan-out follows the
+        # CPU quota, the pool's current load and the expected cost of the work
+        workers = plan_workers(
+            page_count=len(pages),
+            kind=kind,
+            max_workers=max_workers,
+        )
+        cancel_path = None
+        deadline = None
+        if self.cancellation is not None:
+            cancel_path = self.cancellation.path
+            deadline = self.cancellation.deadline
+        if workers == 0 and (PAGE_TIMEOUT_SECONDS > 0 or deadline is not None):
+            # Nothing can stop a page running inline, and how heavy a page
+            # looks says nothing about whether it hangs; while a timeout
+            # applies, even a cheap document goes to a worker that can be
+            # killed
+            workers = 1
+        if workers == 0:
+            # Cheap documents are extracted right here, skipping the IPC
+            with admission.acquire_slot(self.cancellation):
+                seconds, result = timed_call(
+                    fn,
+                    (self.source, pages, *task_args),
+                    cancel_path,
                 )
-                pg_txt = pytesseract.image_to_string(page[0], lang=lang)
-                pg_txt = digits_to_latin(
-                    pg_txt
-                ) if eng_numbering else pg_txt
+            page_costs.observe(kind, seconds, len(pages))
+            yield from result
+            return
+
+        if workers == 1:
+            batches = page_batches(
+                pages=pages,
+                max_workers=workers,
+                min_batch_size=min_batch_size,
+            )
+        else:
+            batches = weighted_batches(
+                weights=page_weights(self.source, pages, kind),
+                max_workers=workers,
+                min_batch_size=min_batch_size,
+            )
+
+        # Keep exactly `workers` tasks in flight and top up as each one
+        # finishes; idle workers pull the next batch from the pool's shared
+        # queue, so a heavy page never holds back the rest of the document
+        pending = deque(batches)
+        futures = {}
+        try:
+            while True:
+                while len(futures) < workers and pending:
+                    batch = pending.popleft()
+                    if deadline is not None and time.time() >= deadline:
+                        for pg_num in batch:
+                            yield self._timed_out(pg_num, empty)
+                        continue
+                    futures[self._submit(fn, batch, task_args)] = batch
+                if not futures:
+                    break
+                waiting = list(futures)
+                if self.cancellation is not None:
+                    waiting.append(self.cancellation.future)
+                done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+                if self.cancellation is not None:
+                    self.cancellation.check()
+                for future in done:
+                    batch = futures.pop(future)
+                    try:
+                        seconds, result = future.result()
+                    except TaskTimeout:
+                        in_time = deadline is None or time.time() < deadline
+                        if len(batch) > 1 and in_time:
+                            # The pages go again one per task, so only the
+                            # one that hangs is lost
+                            pending.extendleft([pg_num] for pg_num in reversed(batch))
+                        else:
+                            for pg_num in batch:
+                                yield self._timed_out(pg_num, empty)
+                        continue
+                    page_costs.observe(kind, seconds, len(batch))
+                    yield from result
+        finally:
+            # Queued work is dropped if the consumer goes away mid-document;
+            # running tasks see the cancel marker at their next page
+            for future in futures:
+                future.cancel()
+
+    def _submit(
+            self,
+            fn,
+            batch: list[int],
+            task_args: tuple,
+    ):
+        return submit_admitted(
+            fn,
+            (self.source, batch, *task_args),
+            self.cancellation,
+        )
+
+    @staticmethod
+    def _timed_out(
+            pg_num: int,
+            empty: dict | None = None,
+    ) -> dict:
         return {
             "page_number": pg_num + 1,
-            "text": pg_txt
+            **(empty or {}),
+            "timed_out": True,
         }
-    
+
     @staticmethod
-    def _extract_image(
-        args,
+    def _page(
+            pg_num: int,
+            pg_txt: str | None,
+            eng_numbering: bool,
     ) -> dict:
-        file_path, pg_num = args
-        with fitz.open(file_path) as doc:
-            pg_imgs = doc.get_page_images(pg_num)
-            imgs_list = []
-            for tup_img in pg_imgs:
-                try: 
-                    xref = tup_img[0]
+        if pg_txt is None:
+            # Ran out of time; such a page is never cached
+            return BaseExtractor._timed_out(pg_num, {"text": ""})
+        return {
+            "page_number": pg_num + 1,
+            "text": digits_to_latin(pg_txt) if eng_numbering else pg_txt,
+        }
+
+    def _iter_ocr(
+            self,
+            pages: list[int],
+            ocr_keys: dict[int, str | None],
+            max_workers: int,
+            lang: str,
+            dpi: int,
+            colorspace: str,
+    ):
+        for page in self._run(
+            OCRExtractor._extract_text,
+            pages,
+            (lang, False, dpi, colorspace),
+            OCR_BATCH_PAGES,
+            max_workers,
+            "ocr",
+        ):
+            pg_num = page["page_number"] - 1
+            if page.get("timed_out"):
+                yield pg_num, None
+                continue
+            self._cache_set(ocr_keys[pg_num], page["text"])
+            yield pg_num, page["text"]
+
+    def _iter_cached_text(
+            self,
+            max_workers: int,
+            eng_numbering: bool,
+            try_ocr: bool,
+            ocr_language: str,
+            pages: list[int] | None,
+    ):
+        # The text layer and the OCR output are cached per page before the
+        # digit conversion, so requests differing only in eng_numbering or
+        # ocr_mode reuse each other's pages and only OCR what is missing
+        text_keys = {}
+        ocr_keys = {}
+        text_missing = []
+        ocr_missing = []
+        for pg_num in self._selected(pages):
+            text_keys[pg_num] = self._page_key(
+                pg_num,
+                backend=type(self).__name__,
+            )
+            if try_ocr:
+                ocr_keys[pg_num] = self._ocr_key(
+                    pg_num,
+                    lang=ocr_language,
+                    dpi=OCR_DPI,
+                    colorspace=OCR_COLORSPACE,
+                )
+            pg_txt = self._cache_get(text_keys[pg_num])
+            if pg_txt is None:
+                text_missing.append(pg_num)
+            elif pg_txt or not try_ocr:
+                yield self._page(pg_num, pg_txt, eng_numbering)
+            else:
+                pg_txt = self._cache_get(ocr_keys[pg_num])
+                if pg_txt is None:
+                    ocr_missing.append(pg_num)
+                else:
+                    yield self._page(pg_num, pg_txt, eng_numbering)
+
+        for page in self._run(
+            self._extract_text,
+            text_missing,
+            (try_ocr, ocr_language, False),
+            OCR_BATCH_PAGES if try_ocr else TEXT_BATCH_PAGES,
+            max_workers,
+            "text+ocr" if try_ocr else "text",
+        ):
+            pg_num = page["page_number"] - 1
+            if page.get("timed_out"):
+                yield self._page(pg_num, None, eng_numbering)
+                continue
+            if page["ocr"]:
+                self._cache_set(text_keys[pg_num], "")
+                self._cache_set(ocr_keys[pg_num], page["text"])
+            else:
+                self._cache_set(text_keys[pg_num], page["text"])
+            yield self._page(pg_num, page["text"], eng_numbering)
+
+        for pg_num, pg_txt in self._iter_ocr(
+            ocr_missing,
+            ocr_keys,
+            max_workers=max_workers,
+            lang=ocr_language,
+            dpi=OCR_DPI,
+            colorspace=OCR_COLORSPACE,
+        ):
+            yield self._page(pg_num, pg_txt, eng_numbering)
+
+    @staticmethod
+    def _sorted(
+            pages,
+    ) -> list[dict]:
+        return sorted(pages, key=lambda x: x["page_number"])
+
+    def close(
+            self,
+    ):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+    def __enter__(
+            self,
+    ):
+        return self
+
+    def __exit__(
+            self,
+            *exc_info,
+    ):
+        self.close()
+
+
+class MuExtractor(BaseExtractor):
+
+    def __init__(
+            self,
+            file_path: str | None = None,
+            content: bytes | memoryview | PdfBuffer | PdfFile | None = None,
+            digest: str | None = None,
+    ):
+        super().__init__(
+            file_path=file_path,
+            content=content,
+            digest=digest,
+        )
+        with source_document(self.source) as doc:
+            self.page_count = len(doc)
+            self.metadata = doc.metadata
+
+    @staticmethod
+    def _extract_text(
+            args,
+    ) -> list[dict]:
+        source, pages, try_ocr, lang, eng_numbering = args
+        results = []
+        with source_document(source) as doc:
+            for pg_num in pages:
+                check_task()
+                pg_txt = doc.get_page_text(pg_num)
+                pg_txt = normalize_digits_and_fix_order(
+                    text=pg_txt,
+                    eng_numbering=eng_numbering
+                )
+                ocr = try_ocr and not pg_txt
+                if ocr:
+                    pg_txt = ocr_page(doc[pg_num], lang=lang)
+                    pg_txt = digits_to_latin(
+                        pg_txt
+                    ) if eng_numbering else pg_txt
+                results.append(
+                    {
+                        "page_number": pg_num + 1,
+                        "text": pg_txt,
+                        "ocr": ocr,
+                    }
+                )
+        return results
+    
+    @staticmethod
+    def _page_images(
+            doc,
+            pg_num: int,
+            bounding_boxes: bool = True,
+            image_data: bool = True,
+    ) -> list[dict]:
+        page = doc[pg_num]
+        imgs_list = []
+        for tup_img in page.get_images():
+            try: 
+                xref = tup_img[0]
+                if image_data:
                     temp_dict = doc.extract_image(xref)
+                else:
+                    # Header fields only; the stream itself is not decoded
+                    temp_dict = {
+                        "width": tup_img[2],
+                        "height": tup_img[3],
+                        "ext": None,
+                        "size": None,
+                        "bpc": tup_img[4],
+                        "cs-name": tup_img[5],
+                    }
+                res = {
+                    "image_name": tup_img[7],
+                    "width_px": temp_dict.get("width"),
+                    "height_px": temp_dict.get("height"),
+                    "file_extension": temp_dict.get("ext"),
+                    "image_size_bytes": temp_dict.get("size"),
+                    "Bits_per_color_component": temp_dict.get("bpc"),
+                    "compression_method": tup_img[-1],
+                    "color_space": temp_dict.get("cs-name"),
+                }
+                if bounding_boxes:
+                    rect = page.get_image_rects(xref)[0]
+                    res["bounding_box"] = {
+                        "x0": rect[0],
+                        "y0": rect[1],
+                        "x1": rect[2],
+                        "y1": rect[3],
+                    }
+                if image_data:
                     image_bytes = temp_dict.get("image")
-                    base64_str = base64.b64encode(image_bytes).decode("utf-8")
-                    res = {
-                        "image_name": tup_img[7],
-                        "width_px": temp_dict.get("width"),
-                        "height_px": temp_dict.get("height"),
-                        "file_extension": temp_dict.get("ext"),
-                        "image_size_bytes": temp_dict.get("size"),
-                        "Bits_per_color_component": temp_dict.get("bpc"),
-                        "compression_method": tup_img[-1],
-                        "color_space": temp_dict.get("cs-name"),
-                        "bounding_box": {
-                            "x0": doc[pg_num].get_image_rects(xref)[0][0],
-                            "y0": doc[pg_num].get_image_rects(xref)[0][1],
-                            "x1": doc[pg_num].get_image_rects(xref)[0][2],
-                            "y1": doc[pg_num].get_image_rects(xref)[0][3],
-                        },
-                        "image_base64": base64_str,
+                    res["image_base64"] = base64.b64encode(image_bytes).decode("utf-8")
+                imgs_list.append(res)
+            except:
+                continue
+        return imgs_list
+
+    @staticmethod
+    def _extract_image(
+        args,
+    ) -> list[dict]:
+        source, pages = args
+        results = []
+        with source_document(source) as doc:
+            for pg_num in pages:
+                check_task()
+                results.append(
+                    {
+                        "page_number": pg_num + 1,
+                        "images": MuExtractor._page_images(doc, pg_num),
                     }
-                    imgs_list.append(res)
-                except:
-                    continue
-            return {
-                "page_number": pg_num + 1,
-                "images": imgs_list
-            }
+                )
+        return results
+
+    @staticmethod
+    def _extract_all(
+            args,
+    ) -> list[dict]:
+        # Text and images of a page from a single open of the document
+        source, pages, text, images, bounding_boxes, image_data, eng_numbering = args
+        results = []
+        with source_document(source) as doc:
+            for pg_num in pages:
+                check_task()
+                result = {
+                    "page_number": pg_num + 1,
+                }
+                if text:
+                    result["text"] = normalize_digits_and_fix_order(
+                        text=doc.get_page_text(pg_num),
+                        eng_numbering=eng_numbering,
+                    )
+                if images:
+                    result["images"] = MuExtractor._page_images(
+                        doc,
+                        pg_num,
+                        bounding_boxes=bounding_boxes,
+                        image_data=image_data,
+                    )
+                results.append(result)
+        return results
 
     def extract_text(
             self,
             max_workers: int = 64,
             eng_numbering: bool = True,
             try_ocr: bool = False,
-            ocr_language: str = "fas"
+            ocr_language: str = "fas",
+            pages: list[int] | None = None,
     ) -> list[dict]:
-        results = []
-
-        for i in range(0, self.page_count, max_workers):
-            chunk_args = [
-                (self.file_path, j, try_ocr, ocr_language, eng_numbering)
-                for j in range(i, min(i + max_workers, self.page_count))
-            ]
-
-            with ProcessPoolExecutor(
-                max_workers=min(max_workers, len(chunk_args))
-            ) as executor:
-                chunk_results = list(
-                    executor.map(
-                        self._extract_text,
-                        chunk_args,
-                    )
-                )
-
-            results.extend(chunk_results)
-        
-        results.sort(key=lambda x: x["page_number"])
+        return self._sorted(
+            self.iter_text(
+                max_workers=max_workers,
+                eng_numbering=eng_numbering,
+                try_ocr=try_ocr,
+                ocr_language=ocr_language,
+                pages=pages,
+            )
+        )
 
-        return results
+    def iter_text(
+            self,
+            max_workers: int = 64,
+            eng_numbering: bool = True,
+            try_ocr: bool = False,
+            ocr_language: str = "fas",
+            pages: list[int] | None = None,
+    ):
+        # Yields pages as they finish, not in page order
+        return self._iter_cached_text(
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            try_ocr=try_ocr,
+            ocr_language=ocr_language,
+            pages=pages,
+        )
     
     def extract_image(
             self,
             max_workers: int = 64,
+            pages: list[int] | None = None,
     ) -> list[dict]:
-        results = []
+        return self._sorted(
+            self.iter_image(
+                max_workers=max_workers,
+                pages=pages,
+            )
+        )
 
-        for i in range(0, self.page_count, max_workers):
-            chunk_args = [
-                (self.file_path, j)
-                for j in range(i, min(i + max_workers, self.page_count))
-            ]
-
-            with ProcessPoolExecutor(
-                max_workers=min(max_workers, len(chunk_args))
-            ) as executor:
-                chunk_results = list(
-                    executor.map(
-                        self._extract_image,
-                        chunk_args,
-                    )
-                )
+    def iter_image(
+            self,
+            max_workers: int = 64,
+            pages: list[int] | None = None,
+    ):
+        return self._run(
+            self._extract_image,
+            self._selected(pages),
+            (),
+            IMAGE_BATCH_PAGES,
+            max_workers,
+            "image",
+            {"images": []},
+        )
 
-            results.extend(chunk_results)
-        
-        results.sort(key=lambda x: x["page_number"])
+    def extract_all(
+            self,
+            max_workers: int = 64,
+            text: bool = True,
+            images: bool = True,
+            metadata: bool = True,
+            bounding_boxes: bool = True,
+            image_data: bool = True,
+            eng_numbering: bool = True,
+            pages: list[int] | None = None,
+    ) -> dict:
+        result = {
+            "pages": self._sorted(
+                self.iter_all(
+                    max_workers=max_workers,
+                    text=text,
+                    images=images,
+                    bounding_boxes=bounding_boxes,
+                    image_data=image_data,
+                    eng_numbering=eng_numbering,
+                    pages=pages,
+                )
+            ),
+        }
+        if metadata:
+            result["metadata"] = self.get_metadata()
+        return result
 
-        return results
+    def iter_all(
+            self,
+            max_workers: int = 64,
+            text: bool = True,
+            images: bool = True,
+            bounding_boxes: bool = True,
+            image_data: bool = True,
+            eng_numbering: bool = True,
+            pages: list[int] | None = None,
+    ):
+        return self._run(
+            self._extract_all,
+            self._selected(pages),
+            (text, images, bounding_boxes, image_data, eng_numbering),
+            IMAGE_BATCH_PAGES if images else TEXT_BATCH_PAGES,
+            max_workers,
+            "all" if images else "text",
+            {
+                **({"text": ""} if text else {}),
+                **({"images": []} if images else {}),
+            },
+        )
 
     def get_metadata(
             self,
     ) -> dict:
-        with fitz.open(self.file_path) as doc:
-            metadata = doc.metadata
-        return metadata
+        # Read once when the document is opened for its page count
+        return self.metadata
 
 
-class PyPDFExtractor:
+class PyPDFExtractor(BaseExtractor):
     def __init__(
             self,
-            file_path: str,
+            file_path: str | None = None,
+            content: bytes | memoryview | PdfBuffer | PdfFile | None = None,
+            digest: str | None = None,
     ):
-        self.file_path = file_path
-        with open(file_path, "rb") as file:
-            reader = PdfReader(file)
-            self.page_count = len(reader.pages)
-            del reader
+        super().__init__(
+            file_path=file_path,
+            content=content,
+            digest=digest,
+        )
+        with mapped_source(self.source) as data:
+            self.page_count = len(open_reader(data).pages)
 
     @staticmethod
     def _extract_text(
             args,
-    ) -> dict:
-        file_path, pg_num, try_ocr, lang, eng_numbering = args
-        with open(file_path, "rb") as file:
-            reader = PdfReader(file)
-            page = reader.pages[pg_num]
-            pg_txt = page.extract_text()
-            pg_txt = normalize_digits_and_fix_order(
-                text=pg_txt,
-                eng_numbering=eng_numbering,
-            )
-            if try_ocr and not pg_txt:
-                page = convert_from_path(
-                    file_path,
-                    first_page=pg_num+1,
-                    last_page=pg_num+1,
-                )
-                pg_txt = pytesseract.image_to_string(page[0], lang=lang)
-                pg_txt = digits_to_latin(
-                    pg_txt
-                ) if eng_numbering else pg_txt
-        return {
-            "page_number": pg_num + 1,
-            "text": pg_txt
-        }
+    ) -> list[dict]:
+        source, pages, try_ocr, lang, eng_numbering = args
+        results = []
+        with mapped_source(source) as data:
+            reader = open_reader(data)
+            doc = None
+            try:
+                for pg_num in pages:
+                    check_task()
+                    page = reader.pages[pg_num]
+                    pg_txt = page.extract_text()
+                    pg_txt = normalize_digits_and_fix_order(
+                        text=pg_txt,
+                        eng_numbering=eng_numbering,
+                    )
+                    ocr = try_ocr and not pg_txt
+                    if ocr:
+                        # PyPDF2 cannot rasterize, so scanned pages go through PyMuPDF
+                        doc = doc or open_document(data)
+                        pg_txt = ocr_page(doc[pg_num], lang=lang)
+                        pg_txt = digits_to_latin(
+                            pg_txt
+                        ) if eng_numbering else pg_txt
+                    results.append(
+                        {
+                            "page_number": pg_num + 1,
+                            "text": pg_txt,
+                            "ocr": ocr,
+                        }
+                    )
+            finally:
+                if doc is not None:
+                    doc.close()
+        return results
     
     def extract_text(
             self,
             max_workers: int = 64,
             eng_numbering: bool = True,
             try_ocr: bool = False,
-            ocr_language: str = "fas"
+            ocr_language: str = "fas",
+            pages: list[int] | None = None,
     ) -> list[dict]:
-        results = []
-
-        for i in range(0, self.page_count, max_workers):
-            chunk_args = [
-                (self.file_path, j, try_ocr, ocr_language, eng_numbering)
-                for j in range(i, min(i + max_workers, self.page_count))
-            ]
-
-            with ProcessPoolExecutor(
-                max_workers=min(max_workers, len(chunk_args))
-            ) as executor:
-                chunk_results = list(
-                    executor.map(
-                        self._extract_text,
-                        chunk_args,
-                    )
-                )
-
-            results.extend(chunk_results)
-        
-        results.sort(key=lambda x: x["page_number"])
+        return self._sorted(
+            self.iter_text(
+                max_workers=max_workers,
+                eng_numbering=eng_numbering,
+                try_ocr=try_ocr,
+                ocr_language=ocr_language,
+                pages=pages,
+            )
+        )
 
-        return results
+    def iter_text(
+            self,
+            max_workers: int = 64,
+            eng_numbering: bool = True,
+            try_ocr: bool = False,
+            ocr_language: str = "fas",
+            pages: list[int] | None = None,
+    ):
+        # Yields pages as they finish, not in page order
+        return self._iter_cached_text(
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            try_ocr=try_ocr,
+            ocr_language=ocr_language,
+            pages=pages,
+        )
 
     def get_metadata(
             self,
     ) -> dict:
-        with open(self.file_path, "rb") as file:
-            reader = PdfReader(file)
-            metadata = reader.metadata            
-        return metadata
+        with mapped_source(self.source) as data:
+            return open_reader(data).metadata
 
 
-class OCRExtractor:
+class OCRExtractor(BaseExtractor):
     def __init__(
             self,
-            file_path: str,
+            file_path: str | None = None,
+            content: bytes | memoryview | PdfBuffer | PdfFile | None = None,
+            digest: str | None = None,
     ):
-        self.file_path = file_path
-        with open(file_path, "rb") as file:
-            reader = PdfReader(file)
-            self.page_count = len(reader.pages)
-            del reader
+        super().__init__(
+            file_path=file_path,
+            content=content,
+            digest=digest,
+        )
+        # Pages are rendered through PyMuPDF, so they are counted by it too
+        with source_document(self.source) as doc:
+            self.page_count = len(doc)
 
     @staticmethod
     def _extract_text(
             args,
-    ) -> dict:
-        file_path, pg_num, lang , eng_numbering = args
-        page = convert_from_path(
-            file_path,
-            first_page=pg_num+1,
-            last_page=pg_num+1,
-        )
-        pg_txt = pytesseract.image_to_string(page[0], lang=lang)
-        pg_txt = digits_to_latin(
-            pg_txt
-        ) if eng_numbering else pg_txt
-        return {
-            "page_number": pg_num + 1,
-            "text": pg_txt,
-        }
+    ) -> list[dict]:
+        source, pages, lang, eng_numbering, dpi, colorspace = args
+        results = []
+        with source_document(source) as doc:
+            for pg_num in pages:
+                check_task()
+                pg_txt = ocr_page(
+                    doc[pg_num],
+                    lang=lang,
+                    dpi=dpi,
+                    colorspace=colorspace,
+                )
+                pg_txt = digits_to_latin(
+                    pg_txt
+                ) if eng_numbering else pg_txt
+                results.append(
+                    {
+                        "page_number": pg_num + 1,
+                        "text": pg_txt,
+                    }
+                )
+        return results
     
     def extract_text(
             self,
             max_workers: int = 64,
             lang: str = "fas",
             eng_numbering: bool = True,
+            dpi: int = OCR_DPI,
+            colorspace: str = OCR_COLORSPACE,
+            pages: list[int] | None = None,
     ) -> list[dict]:
-        results = []
-
-        for i in range(0, self.page_count, max_workers):
-            chunk_args = [
-                (self.file_path, j, lang, eng_numbering)
-                for j in range(i, min(i + max_workers, self.page_count))
-            ]
-
-            with ProcessPoolExecutor(
-                max_workers=min(max_workers, len(chunk_args))
-            ) as executor:
-                chunk_results = list(
-                    executor.map(
-                        self._extract_text,
-                        chunk_args,
-                    )
-                )
+        return self._sorted(
+            self.iter_text(
+                max_workers=max_workers,
+                lang=lang,
+                eng_numbering=eng_numbering,
+                dpi=dpi,
+                colorspace=colorspace,
+                pages=pages,
+            )
+        )
 
-            results.extend(chunk_results)
-        
-        results.sort(key=lambda x: x["page_number"])
+    def iter_text(
+            self,
+            max_workers: int = 64,
+            lang: str = "fas",
+            eng_numbering: bool = True,
+            dpi: int = OCR_DPI,
+            colorspace: str = OCR_COLORSPACE,
+            pages: list[int] | None = None,
+    ):
+        ocr_keys = {}
+        missing = []
+        for pg_num in self._selected(pages):
+            ocr_keys[pg_num] = self._ocr_key(
+                pg_num,
+                lang=lang,
+                dpi=dpi,
+                colorspace=colorspace,
+            )
+            pg_txt = self._cache_get(ocr_keys[pg_num])
+            if pg_txt is None:
+                missing.append(pg_num)
+            else:
+                yield self._page(pg_num, pg_txt, eng_numbering)
 
-        return results
+        for pg_num, pg_txt in self._iter_ocr(
+            missing,
+            ocr_keys,
+            max_workers=max_workers,
+            lang=lang,
+            dpi=dpi,
+            colorspace=colorspace,
+        ):
+            yield self._page(pg_num, pg_txt, eng_numbering)
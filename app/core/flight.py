@@ -0,0 +1,227 @@
+import os
+import time
+import fcntl
+import asyncio
+from .cancel import Cancelled
+
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+COALESCE_DIR = os.getenv("COALESCE_DIR", "/tmp/pdf-extractor-flights")
+COALESCE_POLL_SECONDS = float(os.getenv("COALESCE_POLL_SECONDS", 0.05))
+# Result and lock files older than this are swept
+COALESCE_KEEP_SECONDS = float(os.getenv("COALESCE_KEEP_SECONDS", 60))
+
+
+class SingleFlight:
+    # Identical requests in flight at the same time share one execution.
+    # Within a worker the followers await the leader's future; across
+    # uvicorn workers the leader holds an flock on the key and, if anyone
+    # is waiting on it, leaves its result in a file for them to pick up
+
+    def __init__(
+            self,
+            lock_dir: str = COALESCE_DIR,
+            poll_seconds: float = COALESCE_POLL_SECONDS,
+            keep_seconds: float = COALESCE_KEEP_SECONDS,
+            enabled: bool = COALESCE_ENABLED,
+    ):
+        self.enabled = enabled
+        self.lock_dir = lock_dir
+        self.poll_seconds = poll_seconds
+        self.keep_seconds = keep_seconds
+        self._flights: dict[str, asyncio.Future] = {}
+        self._swept_at = 0.0
+        self.counters = {
+            "leaders": 0,
+            "joined": 0,
+            "shared_across_workers": 0,
+        }
+        if self.enabled:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    async def run(
+            self,
+            key: str,
+            fn,
+    ) -> bytes:
+        # fn is an async callable returning the response body
+        if not self.enabled:
+            return await fn()
+        while True:
+            future = self._flights.get(key)
+            if future is None:
+                break
+            self.counters["joined"] += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leader's client went away; take over unless it is
+                # this request that is being cancelled
+                if not future.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+        try:
+            body = await self._lead(key, fn)
+        except (asyncio.CancelledError, Cancelled):
+            self._flights.pop(key, None)
+            future.cancel()
+            raise
+        except BaseException as e:
+            self._flights.pop(key, None)
+            future.set_exception(e)
+            # Marks it retrieved when nobody joined
+            future.exception()
+            raise
+        self._flights.pop(key, None)
+        future.set_result(body)
+        return body
+
+    async def _acquire(
+            self,
+            path: str,
+    ) -> tuple[int, float | None]:
+        # The locked descriptor of the key's lock file, and since when
+        # another worker's flight was waited on, if it was
+        waited_since = None
+        while True:
+            fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        pass
+                    if waited_since is None:
+                        # Another worker is on it; ask it to share the result
+                        waited_since = time.time()
+                        open(f"{path}.waiting", "w").close()
+                    await asyncio.sleep(self.poll_seconds)
+                # A sweep may have unlinked the file before it was ours, and
+                # a lock on a file nobody else can open shuts no one out
+                current = os.fstat(fd).st_ino == os.stat(f"{path}.lock").st_ino
+            except FileNotFoundError:
+                current = False
+            except BaseException:
+                os.close(fd)
+                raise
+            if current:
+                return fd, waited_since
+            os.close(fd)
+
+    async def _lead(
+            self,
+            key: str,
+            fn,
+    ) -> bytes:
+        path = os.path.join(self.lock_dir, key)
+        fd, waited_since = await self._acquire(path)
+        try:
+            if waited_since is not None:
+                body = self._read(f"{path}.result", waited_since)
+                if body is not None:
+                    self.counters["shared_across_workers"] += 1
+                    return body
+
+            self.counters["leaders"] += 1
+            os.utime(f"{path}.lock")
+            body = await fn()
+            if os.path.exists(f"{path}.waiting"):
+                self._write(f"{path}.result", body)
+                os.unlink(f"{path}.waiting")
+            return body
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+            self._sweep()
+
+    @staticmethod
+    def _read(
+            path: str,
+            since: float,
+    ) -> bytes | None:
+        # Only a result finished while we were waiting counts; anything
+        # older is a previous flight, not this one
+        try:
+            with open(path, "rb") as file:
+                if os.fstat(file.fileno()).st_mtime < since:
+                    return None
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write(
+            path: str,
+            body: bytes,
+    ):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                file.write(body)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Waiters that find no result simply run the request themselves
+            pass
+
+    @staticmethod
+    def _unlink_unless_held(
+            lock_path: str,
+            path: str,
+    ):
+        # A flight still running, however long, keeps its lock file and
+        # the markers of those waiting on it; the lock is held while the
+        # file goes, so nobody picks it up in between
+        try:
+            fd = os.open(lock_path, os.O_RDWR)
+        except FileNotFoundError:
+            fd = None
+        try:
+            if fd is not None:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _sweep(
+            self,
+    ):
+        now = time.time()
+        if now - self._swept_at < self.keep_seconds:
+            return
+        self._swept_at = now
+        for name in os.listdir(self.lock_dir):
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.stat(path).st_mtime >= now - self.keep_seconds:
+                    continue
+            except FileNotFoundError:
+                continue
+            key, extension = os.path.splitext(path)
+            if extension in (".lock", ".waiting"):
+                self._unlink_unless_held(f"{key}.lock", path)
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(
+            self,
+    ) -> dict:
+        return {
+            "enabled": self.enabled,
+            **self.counters,
+            "in_flight": len(self._flights),
+        }
+
+
+single_flight = SingleFlight()
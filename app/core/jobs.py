@@ -0,0 +1,436 @@
+import os
+import json
+import time
+import uuid
+import httpx
+import sqlite3
+import logging
+import threading
+from typing import Iterator
+from contextlib import contextmanager
+from .extractor import MuExtractor, OCRExtractor, PyPDFExtractor
+from .store import document_store
+from .utils import parse_page_ranges
+from .pool import start_pool, shutdown_pool
+
+
+JOBS_DB = os.getenv("JOBS_DB", "/tmp/pdf-extractor-jobs/jobs.db")
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", 2))
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", 1))
+# A running job whose runner has not reported for this long is requeued
+JOBS_STALE_SECONDS = float(os.getenv("JOBS_STALE_SECONDS", 300))
+# Finished jobs and their results are kept this long
+JOBS_TTL = int(os.getenv("JOBS_TTL", 24 * 3600))
+WEBHOOK_ATTEMPTS = int(os.getenv("WEBHOOK_ATTEMPTS", 3))
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    options TEXT NOT NULL,
+    webhook_url TEXT,
+    page_count INTEGER,
+    page_numbers TEXT,
+    pages_done INTEGER NOT NULL DEFAULT 0,
+    metadata TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_pages (
+    job_id TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, page_number)
+);
+"""
+
+
+class JobQueue:
+    # Jobs and their per-page results in one SQLite file; the API writes
+    # new jobs and reads progress, runner processes claim and fill them
+
+    def __init__(
+            self,
+            path: str = JOBS_DB,
+    ):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(
+            self,
+    ) -> Iterator[sqlite3.Connection]:
+        # Autocommit; multi-statement updates open their own transaction
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _job(
+            self,
+            row: sqlite3.Row,
+    ) -> dict:
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "document_id": row["document_id"],
+            "options": json.loads(row["options"]),
+            "webhook_url": row["webhook_url"],
+            "page_count": row["page_count"],
+            "pages_done": row["pages_done"],
+            "metadata": json.loads(row["metadata"]) if row["metadata"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+
+    def submit(
+            self,
+            kind: str,
+            document_id: str,
+            options: dict,
+            page_count: int | None = None,
+            webhook_url: str | None = None,
+    ) -> dict:
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, document_id, options,"
+                " webhook_url, page_count, created_at)"
+                " VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    kind,
+                    document_id,
+                    json.dumps(options),
+                    webhook_url,
+                    page_count,
+                    time.time(),
+                ),
+            )
+        return self.get(job_id)
+
+    def get(
+            self,
+            job_id: str,
+    ) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        return self._job(row) if row else None
+
+    def claim(
+            self,
+    ) -> dict | None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued'"
+                    " ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ?,"
+                        " heartbeat_at = ? WHERE id = ?",
+                        (now, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"]) if row else None
+
+    def start(
+            self,
+            job_id: str,
+            page_numbers: list[int],
+            metadata: dict | None,
+    ):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET page_count = ?, page_numbers = ?, metadata = ?"
+                " WHERE id = ?",
+                (
+                    len(page_numbers),
+                    json.dumps(page_numbers),
+                    json.dumps(metadata),
+                    job_id,
+                ),
+            )
+
+    def add_page(
+            self,
+            job_id: str,
+            page: dict,
+    ):
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            conn.execute(
+                "INSERT OR REPLACE INTO job_pages (job_id, page_number, result)"
+                " VALUES (?, ?, ?)",
+                (job_id, page["page_number"], json.dumps(page)),
+            )
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ?, pages_done = ("
+                "SELECT COUNT(*) FROM job_pages WHERE job_id = ?) WHERE id = ?",
+                (time.time(), job_id, job_id),
+            )
+            conn.execute("COMMIT")
+
+    def finish(
+            self,
+            job_id: str,
+            error: str | None = None,
+    ):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?"
+                " WHERE id = ?",
+                ("failed" if error else "done", error, time.time(), job_id),
+            )
+
+    def pages(
+            self,
+            job_id: str,
+            cursor: int = 0,
+            limit: int = 50,
+    ) -> tuple[list[dict], int | None]:
+        # The cursor is the last page number already returned. Pages finish
+        # out of order, so only the unbroken run after the cursor is handed
+        # out; a page that is still missing holds back the ones behind it.
+        # next_cursor is None once every page has been returned
+        with self._connect() as conn:
+            job = conn.execute(
+                "SELECT page_numbers FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            rows = conn.execute(
+                "SELECT page_number, result FROM job_pages"
+                " WHERE job_id = ? AND page_number > ?"
+                " ORDER BY page_number LIMIT ?",
+                (job_id, cursor, limit),
+            ).fetchall()
+        if job is None or job["page_numbers"] is None:
+            return [], cursor
+        expected = [
+            number for number in json.loads(job["page_numbers"])
+            if number > cursor
+        ]
+        results = []
+        for row, number in zip(rows, expected):
+            if row["page_number"] != number:
+                break
+            results.append(json.loads(row["result"]))
+        if len(results) == len(expected):
+            return results, None
+        return results, results[-1]["page_number"] if results else cursor
+
+    def requeue_stale(
+            self,
+    ) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'running'"
+                " AND heartbeat_at < ?",
+                (time.time() - JOBS_STALE_SECONDS,),
+            ).rowcount
+
+    def sweep(
+            self,
+    ):
+        expired_before = time.time() - JOBS_TTL
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            conn.execute(
+                "DELETE FROM job_pages WHERE job_id IN (SELECT id FROM jobs"
+                " WHERE finished_at < ?)",
+                (expired_before,),
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE finished_at < ?",
+                (expired_before,),
+            )
+            conn.execute("COMMIT")
+
+    def stats(
+            self,
+    ) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS count FROM jobs GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+
+job_queue = JobQueue()
+
+
+def _iter_pages(
+        kind: str,
+        document,
+        options: dict,
+):
+    # The same extractors and options the synchronous routes use
+    max_workers = options.get("max_workers", 32)
+    eng_numbering = options.get("eng_numbering", False)
+    ocr_mode = options.get("ocr_mode", "no_ocr")
+    # As in the routes, a forced OCR text job still takes its metadata from
+    # the text extractor; only the pages come from OCR
+    if kind == "ocr":
+        extractor = OCRExtractor(content=document)
+    elif kind == "text_pypdf":
+        extractor = PyPDFExtractor(content=document)
+    else:
+        extractor = MuExtractor(content=document)
+    pages = None
+    if options.get("pages"):
+        pages = parse_page_ranges(options["pages"], extractor.page_count)
+    page_numbers = [
+        pg_num + 1
+        for pg_num in (range(extractor.page_count) if pages is None else pages)
+    ]
+
+    if kind == "ocr" or (kind.startswith("text") and ocr_mode == "force_ocr"):
+        ocr_extractor = extractor
+        if not isinstance(extractor, OCRExtractor):
+            ocr_extractor = OCRExtractor(content=document)
+        results = ocr_extractor.iter_text(
+            max_workers=max_workers,
+            lang=options.get("ocr_language", "fas"),
+            eng_numbering=eng_numbering,
+            pages=pages,
+        )
+    elif kind == "image_mu":
+        results = extractor.iter_image(
+            max_workers=max_workers,
+            pages=pages,
+        )
+    elif kind == "all_mu":
+        results = extractor.iter_all(
+            max_workers=max_workers,
+            text=options.get("text", True),
+            images=options.get("images", True),
+            bounding_boxes=options.get("bounding_boxes", True),
+            image_data=options.get("image_data", True),
+            eng_numbering=eng_numbering,
+            pages=pages,
+        )
+    else:
+        results = extractor.iter_text(
+            max_workers=max_workers,
+            eng_numbering=eng_numbering,
+            try_ocr=(ocr_mode == "try_ocr"),
+            ocr_language=options.get("ocr_language", "fas"),
+            pages=pages,
+        )
+    return extractor, page_numbers, results
+
+
+def _notify(
+        job: dict,
+):
+    payload = {
+        key: job[key]
+        for key in ("job_id", "kind", "status", "page_count", "pages_done", "error")
+    }
+    for attempt in range(WEBHOOK_ATTEMPTS):
+        try:
+            response = httpx.post(job["webhook_url"], json=payload, timeout=10.0)
+            if response.status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(2 ** attempt)
+    logger.warning("Webhook for job %s could not be delivered", job["job_id"])
+
+
+def run_job(
+        queue: JobQueue,
+        job: dict,
+):
+    error = None
+    document = document_store.open(job["document_id"])
+    try:
+        if document is None:
+            raise LookupError("Document expired before the job ran")
+        with document:
+            extractor, page_numbers, results = _iter_pages(
+                job["kind"],
+                document,
+                job["options"],
+            )
+            metadata = None
+            if job["kind"] != "ocr":
+                metadata = extractor.get_metadata()
+            queue.start(job["job_id"], page_numbers, metadata)
+            for page in results:
+                queue.add_page(job["job_id"], page)
+    except Exception as e:
+        logger.exception("Job %s failed", job["job_id"])
+        error = str(e) or type(e).__name__
+    queue.finish(job["job_id"], error)
+    if job["webhook_url"]:
+        _notify(queue.get(job["job_id"]))
+
+
+def _runner(
+        queue: JobQueue,
+        stop: threading.Event,
+):
+    while not stop.is_set():
+        job = queue.claim()
+        if job is None:
+            stop.wait(JOBS_POLL_SECONDS)
+            continue
+        run_job(queue, job)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    queue = job_queue
+    start_pool()
+    stop = threading.Event()
+    runners = [
+        threading.Thread(target=_runner, args=(queue, stop), daemon=True)
+        for _ in range(JOBS_CONCURRENCY)
+    ]
+    for runner in runners:
+        runner.start()
+    try:
+        while True:
+            requeued = queue.requeue_stale()
+            if requeued:
+                logger.info("Requeued %d stale jobs", requeued)
+            queue.sweep()
+            document_store.sweep()
+            time.sleep(JOBS_STALE_SECONDS / 10)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for runner in runners:
+            runner.join()
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import os
+import fitz
+import ctypes
+import threading
+import pytesseract
+import ctypes.util
+from PIL import Image
+from .cancel import Cancelled, task_cancelled
+
+
+OCR_DPI = int(os.getenv("OCR_DPI", 200))
+OCR_COLORSPACE = os.getenv("OCR_COLORSPACE", "rgb")
+OCR_BACKEND = os.getenv("OCR_BACKEND", "capi")
+
+# tesseract::PSM_AUTO, the page segmentation mode the tesseract CLI uses
+PSM_AUTO = 3
+
+# bool (*TessCancelFunc)(void* cancel_this, int words)
+TessCancelFunc = ctypes.CFUNCTYPE(ctypes.c_bool, ctypes.c_void_p, ctypes.c_int)
+
+COLORSPACES = {
+    "rgb": (fitz.csRGB, "RGB"),
+    "gray": (fitz.csGRAY, "L"),
+}
+
+
+def render_page(
+        page: fitz.Page,
+        dpi: int = OCR_DPI,
+        colorspace: str = OCR_COLORSPACE,
+) -> fitz.Pixmap:
+    return page.get_pixmap(
+        dpi=dpi,
+        colorspace=COLORSPACES[colorspace][0],
+        alpha=False,
+    )
+
+
+def _load_libtesseract() -> ctypes.CDLL | None:
+    name = ctypes.util.find_library("tesseract") or "libtesseract.so.5"
+    try:
+        lib = ctypes.CDLL(name)
+    except OSError:
+        return None
+
+    lib.TessBaseAPICreate.restype = ctypes.c_void_p
+    lib.TessBaseAPIDelete.argtypes = [ctypes.c_void_p]
+    lib.TessBaseAPIInit3.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_char_p,
+        ctypes.c_char_p,
+    ]
+    lib.TessBaseAPISetPageSegMode.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    lib.TessBaseAPISetVariable.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_char_p,
+        ctypes.c_char_p,
+    ]
+    lib.TessBaseAPISetImage.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_void_p,
+        ctypes.c_int,
+        ctypes.c_int,
+        ctypes.c_int,
+        ctypes.c_int,
+    ]
+    lib.TessMonitorCreate.restype = ctypes.c_void_p
+    lib.TessMonitorDelete.argtypes = [ctypes.c_void_p]
+    lib.TessMonitorSetCancelFunc.argtypes = [ctypes.c_void_p, TessCancelFunc]
+    lib.TessBaseAPIRecognize.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+    lib.TessBaseAPIGetStringVariable.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+    lib.TessBaseAPIGetStringVariable.restype = ctypes.c_char_p
+    lib.TessBaseAPIGetUTF8Text.argtypes = [ctypes.c_void_p]
+    lib.TessBaseAPIGetUTF8Text.restype = ctypes.c_void_p
+    lib.TessDeleteText.argtypes = [ctypes.c_void_p]
+    lib.TessBaseAPIClear.argtypes = [ctypes.c_void_p]
+    lib.TessBaseAPIEnd.argtypes = [ctypes.c_void_p]
+    return lib
+
+
+@TessCancelFunc
+def _cancel_requested(
+        cancel_this,
+        words,
+) -> bool:
+    return task_cancelled()
+
+
+class TesseractEngine:
+
+    def __init__(
+            self,
+            lib: ctypes.CDLL,
+            lang: str,
+    ):
+        self._lib = lib
+        self._lock = threading.Lock()
+        self._handle = lib.TessBaseAPICreate()
+        if lib.TessBaseAPIInit3(self._handle, None, lang.encode()) != 0:
+            lib.TessBaseAPIDelete(self._handle)
+            raise RuntimeError(
+                f"Could not initialize tesseract for language '{lang}'"
+            )
+        lib.TessBaseAPISetPageSegMode(self._handle, PSM_AUTO)
+
+    def recognize(
+            self,
+            pix: fitz.Pixmap,
+            dpi: int = OCR_DPI,
+    ) -> str:
+        lib, handle = self._lib, self._handle
+        with self._lock:
+            lib.TessBaseAPISetVariable(
+                handle,
+                b"user_defined_dpi",
+                str(dpi).encode(),
+            )
+            # Tesseract copies the samples, so the pixmap only has to
+            # outlive this call
+            lib.TessBaseAPISetImage(
+                handle,
+                pix.samples_ptr,
+                pix.width,
+                pix.height,
+                pix.n,
+                pix.stride,
+            )
+            # Recognition polls the monitor as it goes, so a page of a
+            # request whose client is gone stops part way through
+            monitor = lib.TessMonitorCreate()
+            lib.TessMonitorSetCancelFunc(monitor, _cancel_requested)
+            try:
+                failed = lib.TessBaseAPIRecognize(handle, monitor) != 0
+            finally:
+                lib.TessMonitorDelete(monitor)
+            if task_cancelled():
+                lib.TessBaseAPIClear(handle)
+                raise Cancelled("The client went away")
+            if failed:
+                lib.TessBaseAPIClear(handle)
+                raise RuntimeError("Tesseract could not recognize the page")
+            text_ptr = lib.TessBaseAPIGetUTF8Text(handle)
+            if not text_ptr:
+                lib.TessBaseAPIClear(handle)
+                raise RuntimeError("Tesseract could not recognize the page")
+            # The tesseract CLI behind pytesseract ends every page with
+            # page_separator ("\f" unless configured otherwise); the same
+            # here keeps the text identical whichever backend runs
+            separator = lib.TessBaseAPIGetStringVariable(handle, b"page_separator")
+            try:
+                return (
+                    ctypes.string_at(text_ptr) + (separator or b"")
+                ).decode("utf-8")
+            finally:
+                lib.TessDeleteText(text_ptr)
+                lib.TessBaseAPIClear(handle)
+
+    def close(
+            self,
+    ):
+        self._lib.TessBaseAPIEnd(self._handle)
+        self._lib.TessBaseAPIDelete(self._handle)
+
+
+_libtesseract = _load_libtesseract() if OCR_BACKEND == "capi" else None
+_engines: dict[str, TesseractEngine] = {}
+
+
+def get_engine(
+        lang: str,
+) -> TesseractEngine | None:
+    # One engine per language and process: the traineddata is loaded on
+    # first use and reused by every later page and request in this worker
+    if _libtesseract is None:
+        return None
+    engine = _engines.get(lang)
+    if engine is None:
+        engine = _engines[lang] = TesseractEngine(_libtesseract, lang)
+    return engine
+
+
+def ocr_backend() -> str:
+    # The backend that actually runs, which is the CLI when libtesseract
+    # could not be loaded
+    return "capi" if _libtesseract is not None else "pytesseract"
+
+
+def ocr_pixmap(
+        pix: fitz.Pixmap,
+        lang: str,
+        dpi: int = OCR_DPI,
+) -> str:
+    engine = get_engine(lang)
+    if engine is not None:
+        return engine.recognize(pix, dpi=dpi)
+
+    mode = "L" if pix.n == 1 else "RGB"
+    # Wrap the pixmap samples in place instead of copying them
+    image = Image.frombuffer(
+        mode,
+        (pix.width, pix.height),
+        pix.samples_mv,
+        "raw",
+        mode,
+        pix.stride,
+        1,
+    )
+    return pytesseract.image_to_string(
+        image,
+        lang=lang,
+        config=f"--dpi {dpi}",
+    )
+
+
+def ocr_page(
+        page: fitz.Page,
+        lang: str,
+        dpi: int = OCR_DPI,
+        colorspace: str = OCR_COLORSPACE,
+) -> str:
+    pix = render_page(page, dpi=dpi, colorspace=colorspace)
+    return ocr_pixmap(pix, lang=lang, dpi=dpi)
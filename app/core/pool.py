@@ -0,0 +1,438 @@
+import os
+import math
+import time
+import uuid
+import queue
+import threading
+import multiprocessing
+from functools import partial
+from .cancel import end_task, start_task
+from concurrent.futures import Future
+from multiprocessing import resource_tracker
+from multiprocessing.connection import wait
+
+
+def cpu_limit() -> int:
+    # The container's CPU quota, not the host's core count
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as file:
+            quota = int(file.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as file:
+            period = int(file.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+CPU_LIMIT = cpu_limit()
+POOL_WORKERS = int(os.getenv("POOL_WORKERS", CPU_LIMIT))
+TASKS_PER_WORKER = int(os.getenv("TASKS_PER_WORKER", 4))
+# Documents expected to finish faster than this run inline, without the pool
+INLINE_SECONDS = float(os.getenv("INLINE_SECONDS", 0.05))
+# Smallest amount of work worth handing to another process
+MIN_TASK_SECONDS = float(os.getenv("MIN_TASK_SECONDS", 0.02))
+# A page running longer than this has its worker killed and replaced
+PAGE_TIMEOUT_SECONDS = float(os.getenv("PAGE_TIMEOUT_SECONDS", 60))
+TASK_DIR = os.getenv("TASK_DIR", "/tmp/pdf-extractor-tasks")
+TASK_CHECK_SECONDS = float(os.getenv("TASK_CHECK_SECONDS", 0.25))
+# Runs a task gets again when its worker dies under it
+TASK_RETRIES = int(os.getenv("TASK_RETRIES", 2))
+
+# Starting per-page estimates, refined by what the workers actually report
+DEFAULT_PAGE_SECONDS = {
+    "text": 0.003,
+    "text+ocr": 0.5,
+    "image": 0.02,
+    "all": 0.025,
+    "ocr": 1.5,
+}
+
+_workers: list["_Worker"] | None = None
+_queue: queue.Queue = queue.Queue()
+_pool_lock = threading.Lock()
+_watchdog: threading.Thread | None = None
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+_tasks: set["_Task"] = set()
+_counters = {
+    "tasks_timed_out": 0,
+    "tasks_lost": 0,
+    "tasks_retried": 0,
+    "workers_replaced": 0,
+}
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+class CostModel:
+
+    def __init__(
+            self,
+            defaults: dict[str, float],
+            alpha: float = 0.2,
+    ):
+        self._seconds = dict(defaults)
+        self._alpha = alpha
+        self._lock = threading.Lock()
+
+    def estimate(
+            self,
+            kind: str,
+    ) -> float:
+        return self._seconds.get(kind, max(self._seconds.values()))
+
+    def observe(
+            self,
+            kind: str,
+            seconds: float,
+            pages: int,
+    ):
+        if pages <= 0:
+            return
+        per_page = seconds / pages
+        with self._lock:
+            previous = self._seconds.get(kind, per_page)
+            self._seconds[kind] = (
+                (1 - self._alpha) * previous + self._alpha * per_page
+            )
+
+    def stats(
+            self,
+    ) -> dict[str, float]:
+        return dict(self._seconds)
+
+
+page_costs = CostModel(DEFAULT_PAGE_SECONDS)
+
+
+def _serve(
+        conn,
+):
+    # A worker process: runs what it is sent until it is told to stop
+    while (job := conn.recv()) is not None:
+        try:
+            reply = True, timed_call(*job)
+        except BaseException as e:
+            reply = False, e
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # The result or the error could not be pickled
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class _Worker:
+    # One process, fed by its own thread here. Killing or losing it only
+    # touches the task it was running; the others never notice
+
+    def __init__(
+            self,
+    ):
+        self.killed = False
+        self._spawn()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _spawn(
+            self,
+    ):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_serve,
+            args=(child,),
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+
+    def _respawn(
+            self,
+    ):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.killed = False
+        self._spawn()
+        _counters["workers_replaced"] += 1
+
+    def kill(
+            self,
+    ):
+        # Called with _pool_lock held, while the task is still ours
+        self.killed = True
+        self.process.kill()
+
+    def _call(
+            self,
+            task: "_Task",
+    ) -> tuple[bool, object] | None:
+        # None when the process goes away before it answers
+        try:
+            self.conn.send(
+                (task.fn, task.args, task.cancel_path, task.progress_path)
+            )
+        except OSError:
+            return None
+        except Exception as e:
+            return False, e
+        try:
+            wait([self.conn, self.process.sentinel])
+            return self.conn.recv()
+        except (EOFError, OSError):
+            return None
+
+    def _run(
+            self,
+    ):
+        while (task := _queue.get()) is not None:
+            with _pool_lock:
+                if task.future.done() or not task.future.set_running_or_notify_cancel():
+                    continue
+                task.worker = self
+            while True:
+                reply = self._call(task)
+                with _pool_lock:
+                    killed = self.killed
+                    retry = reply is None and not killed and task.retries < TASK_RETRIES
+                    if not retry:
+                        task.worker = None
+                if reply is None or killed:
+                    # A dead worker does not clear its progress file
+                    try:
+                        os.unlink(task.progress_path)
+                    except FileNotFoundError:
+                        pass
+                    self._respawn()
+                if not retry:
+                    break
+                task.retries += 1
+                _counters["tasks_retried"] += 1
+            _settle(task, reply)
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join()
+
+
+def _settle(
+        task: "_Task",
+        reply: tuple[bool, object] | None,
+):
+    if reply is None:
+        # A task whose worker keeps dying fails like one that hangs, so
+        # callers narrow it down to the page behind it the same way
+        if task.timed_out:
+            _counters["tasks_timed_out"] += 1
+            task.future.set_exception(TaskTimeout("The task ran out of time"))
+        else:
+            _counters["tasks_lost"] += 1
+            task.future.set_exception(TaskTimeout("The worker running the task died"))
+    elif reply[0]:
+        task.future.set_result(reply[1])
+    else:
+        task.future.set_exception(reply[1])
+
+
+def start_pool(
+        max_workers: int = POOL_WORKERS,
+):
+    global _workers, _watchdog
+    with _pool_lock:
+        if _workers is None:
+            # Workers attach to request buffers in shared memory; a tracker
+            # started before the fork is shared with them instead of one each
+            resource_tracker.ensure_running()
+            os.makedirs(TASK_DIR, exist_ok=True)
+            # Every worker is forked up front so the first request finds
+            # a warm pool
+            _workers = [_Worker() for _ in range(max_workers)]
+        if _watchdog is None:
+            _watchdog = threading.Thread(target=_watch, daemon=True)
+            _watchdog.start()
+
+
+def shutdown_pool():
+    global _workers
+    with _pool_lock:
+        workers, _workers = _workers, None
+    if workers is None:
+        return
+    # Queued tasks are cancelled, running ones finish
+    while True:
+        try:
+            task = _queue.get_nowait()
+        except queue.Empty:
+            break
+        task.future.cancel()
+    for _ in workers:
+        _queue.put(None)
+    for worker in workers:
+        worker.thread.join()
+
+
+def timed_call(
+        fn,
+        args,
+        cancel_path: str | None = None,
+        progress_path: str | None = None,
+) -> tuple[float, list]:
+    # cancel_path names the marker the request drops if its client goes away
+    start_task(cancel_path, progress_path)
+    try:
+        started = time.perf_counter()
+        result = fn(args)
+        return time.perf_counter() - started, result
+    finally:
+        end_task()
+
+
+class _Task:
+
+    def __init__(
+            self,
+            fn,
+            args,
+            cancel_path: str | None,
+            deadline: float | None,
+    ):
+        self.fn = fn
+        self.args = args
+        self.cancel_path = cancel_path
+        self.deadline = deadline
+        self.progress_path = os.path.join(TASK_DIR, uuid.uuid4().hex)
+        self.future = Future()
+        # The worker running it, None while queued or once it is over
+        self.worker = None
+        self.retries = 0
+        self.timed_out = False
+
+
+def _overdue(
+        task: _Task,
+        now: float,
+) -> bool:
+    if task.deadline is not None and now >= task.deadline:
+        return True
+    if PAGE_TIMEOUT_SECONDS <= 0:
+        return False
+    try:
+        # Touched by the worker as each page starts
+        page_started = os.stat(task.progress_path).st_mtime
+    except FileNotFoundError:
+        # Not started yet, or already done
+        return False
+    return now - page_started >= PAGE_TIMEOUT_SECONDS
+
+
+def _watch():
+    while True:
+        time.sleep(TASK_CHECK_SECONDS)
+        now = time.time()
+        with _in_flight_lock:
+            tasks = list(_tasks)
+        for task in tasks:
+            if task.timed_out or task.future.done() or not _overdue(task, now):
+                continue
+            with _pool_lock:
+                if task.worker is not None:
+                    # Takes down its worker alone, which is then replaced
+                    task.timed_out = True
+                    task.worker.kill()
+                elif not task.future.running() and not task.future.done():
+                    # Still queued, it is simply dropped
+                    task.timed_out = True
+                    _counters["tasks_timed_out"] += 1
+                    task.future.set_exception(
+                        TaskTimeout("The request ran out of time")
+                    )
+
+
+def submit(
+        fn,
+        args,
+        cancel_path: str | None = None,
+        deadline: float | None = None,
+) -> Future:
+    # deadline is the request's, as a time.time() value; pages running
+    # past PAGE_TIMEOUT_SECONDS are timed out whatever the deadline
+    global _in_flight
+    start_pool()
+    task = _Task(fn, args, cancel_path, deadline)
+    with _in_flight_lock:
+        _in_flight += 1
+        _tasks.add(task)
+    task.future.add_done_callback(partial(_task_done, task))
+    _queue.put(task)
+    return task.future
+
+
+def _task_done(
+        task: _Task,
+        _,
+):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+        _tasks.discard(task)
+
+
+def pool_load() -> int:
+    return _in_flight
+
+
+def plan_workers(
+        page_count: int,
+        kind: str,
+        max_workers: int,
+) -> int:
+    # 0 means the document is cheap enough to extract inline
+    total_seconds = page_count * page_costs.estimate(kind)
+    if total_seconds <= INLINE_SECONDS:
+        return 0
+    idle = max(1, POOL_WORKERS - pool_load())
+    useful = math.ceil(total_seconds / MIN_TASK_SECONDS)
+    return max(
+        1,
+        min(max_workers, CPU_LIMIT, POOL_WORKERS, idle, useful, page_count),
+    )
+
+
+def page_batches(
+        pages: list[int],
+        max_workers: int,
+        min_batch_size: int = 1,
+) -> list[list[int]]:
+    # A few tasks per worker keeps the load balanced while the document
+    # open and the IPC round trip are paid once per batch, not per page
+    max_workers = max(1, max_workers)
+    batch_size = max(
+        min_batch_size,
+        math.ceil(len(pages) / (max_workers * TASKS_PER_WORKER)),
+    )
+    return [
+        pages[start:start + batch_size]
+        for start in range(0, len(pages), batch_size)
+    ]
+
+
+def pool_stats() -> dict:
+    return {
+        "cpu_limit": CPU_LIMIT,
+        "pool_workers": POOL_WORKERS,
+        "tasks_in_flight": pool_load(),
+        "page_timeout_seconds": PAGE_TIMEOUT_SECONDS,
+        **_counters,
+        "page_seconds": page_costs.stats(),
+    }
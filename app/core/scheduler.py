@@ -0,0 +1,95 @@
+import os
+from .pool import TASKS_PER_WORKER
+from .buffer import SharedPdf, source_document
+
+
+# Relative page weights; only their ratios matter
+CONTENT_BYTES_PER_UNIT = int(os.getenv("CONTENT_BYTES_PER_UNIT", 64 * 1024))
+IMAGE_WEIGHT = float(os.getenv("IMAGE_WEIGHT", 4))
+SCANNED_PAGE_WEIGHT = float(os.getenv("SCANNED_PAGE_WEIGHT", 200))
+RENDER_PAGE_WEIGHT = float(os.getenv("RENDER_PAGE_WEIGHT", 50))
+
+
+def _stream_length(
+        doc,
+        xref: int,
+) -> int:
+    # The declared /Length of the raw (still compressed) stream, read from
+    # its dictionary without loading the stream itself
+    kind, value = doc.xref_get_key(xref, "Length")
+    try:
+        if kind == "xref":
+            return int(doc.xref_object(int(value.split()[0])))
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def _content_bytes(
+        doc,
+        page,
+) -> int:
+    return sum(_stream_length(doc, xref) for xref in page.get_contents())
+
+
+def _has_text(
+        page,
+) -> bool:
+    # A page drawing text needs a font in its resources; scanned pages
+    # have none, and the content streams do not have to be inflated
+    return bool(page.get_fonts())
+
+
+def page_weights(
+        source: str | SharedPdf,
+        pages: list[int],
+        kind: str,
+) -> dict[int, float]:
+    weights = {}
+    with source_document(source) as doc:
+        for pg_num in pages:
+            page = doc[pg_num]
+            images = len(page.get_images())
+            content = _content_bytes(doc, page) / CONTENT_BYTES_PER_UNIT
+            if kind == "image":
+                weight = 1 + images * IMAGE_WEIGHT
+            elif kind == "all":
+                weight = 1 + images * IMAGE_WEIGHT + content
+            elif kind == "ocr":
+                weight = RENDER_PAGE_WEIGHT + images * IMAGE_WEIGHT + content
+            elif kind == "text+ocr" and not _has_text(page):
+                weight = SCANNED_PAGE_WEIGHT + images * IMAGE_WEIGHT
+            else:
+                weight = 1 + content
+            weights[pg_num] = weight
+    return weights
+
+
+def weighted_batches(
+        weights: dict[int, float],
+        max_workers: int,
+        min_batch_size: int = 1,
+) -> list[list[int]]:
+    # Heaviest first, so the long pages start right away and the light
+    # ones fill the gaps at the end (longest processing time first)
+    order = sorted(weights, key=lambda pg_num: weights[pg_num], reverse=True)
+    target = sum(weights.values()) / (max(1, max_workers) * TASKS_PER_WORKER)
+    batches = []
+    batch = []
+    batch_weight = 0.0
+    for pg_num in order:
+        batch.append(pg_num)
+        batch_weight += weights[pg_num]
+        # A page heavy enough to fill a whole batch on its own does not
+        # wait for min_batch_size companions
+        if batch_weight >= target and (
+            len(batch) >= min_batch_size
+            or weights[batch[0]] >= target * min_batch_size
+        ):
+            batches.append(sorted(batch))
+            batch = []
+            batch_weight = 0.0
+    if batch:
+        batches.append(sorted(batch))
+    return batches
+
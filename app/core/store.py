@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import fcntl
+import shutil
+from .buffer import PdfFile, warm_directories
+
+
+STORE_DIR = os.getenv("STORE_DIR", "/tmp/pdf-extractor-store")
+STORE_TTL = int(os.getenv("STORE_TTL", 3600))
+STORE_MAX_BYTES = int(os.getenv("STORE_MAX_BYTES", 4 * 1024 * 1024 * 1024))
+
+DOCUMENT_ID = re.compile(r"[0-9a-f]{64}")
+
+
+class StoredPdf(PdfFile):
+    # A handle on a stored document. It holds a shared flock for as long
+    # as an extraction uses it, so the sweeper leaves the file alone, and
+    # closing it only drops the lock; the file stays in the store
+
+    def __init__(
+            self,
+            path: str,
+            size: int,
+            document_id: str,
+            fd: int,
+    ):
+        super().__init__(path, size)
+        self.digest = document_id
+        self._fd = fd
+
+    def close(
+            self,
+    ):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class DocumentStore:
+    # Uploaded documents addressed by their sha256, shared by every uvicorn
+    # worker through the directory; a document expires STORE_TTL seconds
+    # after its last upload
+
+    def __init__(
+            self,
+            directory: str = STORE_DIR,
+            ttl: int = STORE_TTL,
+            max_bytes: int = STORE_MAX_BYTES,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        warm_directories.add(os.path.abspath(directory))
+
+    def _path(
+            self,
+            document_id: str,
+    ) -> str | None:
+        if not DOCUMENT_ID.fullmatch(document_id):
+            return None
+        return os.path.join(self.directory, f"{document_id}.pdf")
+
+    def _info(
+            self,
+            document_id: str,
+            stat: os.stat_result,
+    ) -> dict:
+        return {
+            "document_id": document_id,
+            "size": stat.st_size,
+            "expires_at": stat.st_mtime + self.ttl,
+        }
+
+    def put(
+            self,
+            document: PdfFile,
+    ) -> dict:
+        document_id = document.digest
+        path = self._path(document_id)
+        if os.path.exists(path):
+            # Same content uploaded again; only its expiry moves
+            os.utime(path)
+            document.close()
+        else:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            shutil.move(document.path, tmp_path)
+            os.replace(tmp_path, path)
+            document.path = None
+        self.sweep()
+        return self._info(document_id, os.stat(path))
+
+    def open(
+            self,
+            document_id: str,
+    ) -> StoredPdf | None:
+        path = self._path(document_id)
+        if path is None:
+            return None
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        try:
+            stat = os.fstat(fd)
+            # The sweeper may have unlinked it while we waited for the lock
+            if stat.st_ino != os.stat(path).st_ino:
+                raise FileNotFoundError(path)
+        except FileNotFoundError:
+            os.close(fd)
+            return None
+        if stat.st_mtime + self.ttl < time.time():
+            os.close(fd)
+            return None
+        return StoredPdf(path, stat.st_size, document_id, fd)
+
+    def info(
+            self,
+            document_id: str,
+    ) -> dict | None:
+        path = self._path(document_id)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if stat.st_mtime + self.ttl < time.time():
+            return None
+        return self._info(document_id, stat)
+
+    def _remove(
+            self,
+            path: str,
+    ) -> bool:
+        # Only documents no extraction is reading are removed
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return True
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+        return True
+
+    def delete(
+            self,
+            document_id: str,
+    ) -> bool | None:
+        # None when there is no such document, False while it is in use
+        path = self._path(document_id)
+        if path is None or not os.path.exists(path):
+            return None
+        return self._remove(path)
+
+    def _entries(
+            self,
+    ) -> list[tuple[float, int, str]]:
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pdf"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def sweep(
+            self,
+    ):
+        # Expired documents go first, then the oldest until under the cap
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        expired_before = time.time() - self.ttl
+        for mtime, size, path in entries:
+            if mtime >= expired_before and total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= size
+
+    def stats(
+            self,
+    ) -> dict:
+        entries = self._entries()
+        return {
+            "documents": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+        }
+
+
+document_store = DocumentStore()
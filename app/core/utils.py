@@ -26,3 +26,28 @@ def digits_to_latin(text: str):
     TRANSLATE_TABLE = {**ARABIC_INDIC_MAP, **PERSIAN_MAP}
 
     return text.translate(TRANSLATE_TABLE)
+
+
+def parse_page_ranges(
+        spec: str,
+        page_count: int,
+) -> list[int]:
+    # "1-3,10,20-" -> zero-based page indexes; pages past the end are dropped
+    pages = set()
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        first, sep, last = item.partition("-")
+        try:
+            start = int(first) if first.strip() else 1
+            # An open range runs to the end, wherever that is
+            stop = (int(last) if last.strip() else None) if sep else start
+        except ValueError:
+            raise ValueError(f"Invalid page range '{item}'") from None
+        if start < 1 or (stop is not None and stop < start):
+            raise ValueError(f"Invalid page range '{item}'")
+        if stop is None or stop > page_count:
+            stop = page_count
+        pages.update(range(start - 1, stop))
+    return sorted(pages)
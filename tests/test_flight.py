@@ -0,0 +1,46 @@
+import os
+import fcntl
+import asyncio
+from app.core.flight import SingleFlight
+
+
+def _age(path, seconds=120):
+    os.utime(path, (os.path.getmtime(path) - seconds,) * 2)
+
+
+def test_sweep_keeps_files_of_a_running_flight(tmp_path):
+    flight = SingleFlight(lock_dir=str(tmp_path), keep_seconds=60, enabled=True)
+    for name in ("running.lock", "running.waiting", "done.lock", "done.waiting", "done.result"):
+        (tmp_path / name).touch()
+        _age(tmp_path / name)
+    fd = os.open(tmp_path / "running.lock", os.O_RDWR)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        flight._sweep()
+    finally:
+        os.close(fd)
+
+    assert sorted(os.listdir(tmp_path)) == ["running.lock", "running.waiting"]
+
+
+def test_lead_does_not_keep_a_swept_lock(tmp_path):
+    # The lock file goes away while a waiter sits on it; the waiter must
+    # lock the file that is there now, not the one it opened
+    flight = SingleFlight(lock_dir=str(tmp_path), poll_seconds=0.01, enabled=True)
+    path = tmp_path / "key.lock"
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+
+    async def run():
+        async def body():
+            return str(os.stat(path).st_ino).encode()
+
+        task = asyncio.ensure_future(flight._lead("key", body))
+        await asyncio.sleep(0.05)
+        os.unlink(path)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return await task
+
+    locked = asyncio.run(run())
+    os.close(fd)
+    assert locked == str(os.stat(path).st_ino).encode()
@@ -0,0 +1,68 @@
+import fitz
+import pytest
+from app.core import jobs, extractor
+from app.core.cache import result_cache
+from app.core.buffer import PdfFile
+from app.core.store import DocumentStore
+
+
+KINDS = [
+    ("text_mu", "no_ocr"),
+    ("text_mu", "try_ocr"),
+    ("text_mu", "force_ocr"),
+    ("text_pypdf", "no_ocr"),
+    ("text_pypdf", "try_ocr"),
+    ("text_pypdf", "force_ocr"),
+    ("image_mu", "no_ocr"),
+    ("all_mu", "no_ocr"),
+    ("ocr", "no_ocr"),
+]
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    # Pages are extracted inline with a stand-in OCR, so neither the pool
+    # nor Tesseract is needed
+    monkeypatch.setattr(extractor, "plan_workers", lambda **_: 0)
+    monkeypatch.setattr(extractor, "PAGE_TIMEOUT_SECONDS", 0)
+    monkeypatch.setattr(extractor, "ocr_page", lambda page, **_: f"ocr {page.number}")
+    monkeypatch.setattr(result_cache, "enabled", False)
+    monkeypatch.setattr(jobs, "document_store", DocumentStore(str(tmp_path / "store")))
+    return jobs.JobQueue(str(tmp_path / "jobs.db"))
+
+
+@pytest.fixture
+def document_id(tmp_path, queue):
+    path = tmp_path / "upload.pdf"
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), "first")
+        doc.new_page()
+        doc.set_metadata({"title": "Jobs"})
+        doc.save(path)
+    document = PdfFile(str(path), path.stat().st_size)
+    return jobs.document_store.put(document)["document_id"]
+
+
+@pytest.mark.parametrize("kind, ocr_mode", KINDS)
+def test_every_job_kind_runs(queue, document_id, kind, ocr_mode):
+    submitted = queue.submit(kind, document_id, {"ocr_mode": ocr_mode})
+    job = queue.claim()
+    assert job["job_id"] == submitted["job_id"]
+
+    jobs.run_job(queue, job)
+
+    job = queue.get(job["job_id"])
+    assert job["error"] is None
+    assert job["status"] == "done"
+    assert job["pages_done"] == job["page_count"] == 2
+    if kind == "ocr":
+        assert job["metadata"] is None
+    else:
+        assert job["metadata"]
+    pages, next_cursor = queue.pages(job["job_id"])
+    assert next_cursor is None
+    assert [page["page_number"] for page in pages] == [1, 2]
+    if kind == "ocr" or ocr_mode == "force_ocr":
+        assert [page["text"] for page in pages] == ["ocr 0", "ocr 1"]
+    elif ocr_mode == "try_ocr":
+        assert pages[1]["text"] == "ocr 1"
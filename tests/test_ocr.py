@@ -0,0 +1,53 @@
+import ctypes
+import fitz
+from app.core import ocr, extractor
+
+
+class _FakeTesseract:
+    # Stands in for libtesseract; only what recognize() calls
+
+    def __init__(self, text: bytes, separator: bytes):
+        self._text = ctypes.create_string_buffer(text)
+        self._separator = separator
+
+    def __getattr__(self, name):
+        return lambda *args: 0
+
+    def TessBaseAPIGetUTF8Text(self, handle):
+        return ctypes.addressof(self._text)
+
+    def TessBaseAPIGetStringVariable(self, handle, name):
+        assert name == b"page_separator"
+        return self._separator
+
+
+def test_recognize_ends_the_page_like_the_cli():
+    engine = ocr.TesseractEngine(_FakeTesseract("سلام\n".encode(), b"\f"), "fas")
+    pix = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 1, 1), False)
+
+    assert engine.recognize(pix) == "سلام\n\f"
+
+
+def test_ocr_cache_key_follows_the_backend(monkeypatch):
+    with fitz.open() as doc:
+        doc.new_page()
+        data = doc.tobytes()
+    document = extractor.MuExtractor(content=data)
+
+    monkeypatch.setattr(ocr, "_libtesseract", None)
+    cli_key = document._ocr_key(0, "fas", 200, "rgb")
+    monkeypatch.setattr(ocr, "_libtesseract", object())
+    capi_key = document._ocr_key(0, "fas", 200, "rgb")
+
+    assert cli_key is not None and cli_key != capi_key
+
+
+def test_ocr_counts_pages_of_a_repairable_pdf():
+    with fitz.open() as doc:
+        doc.new_page()
+        doc.new_page()
+        data = doc.tobytes()
+    # No xref table; MuPDF rebuilds it, PyPDF2 cannot
+    data = data[:data.rfind(b"xref")]
+
+    assert extractor.OCRExtractor(content=data).page_count == 2
@@ -0,0 +1,75 @@
+import os
+import time
+import fitz
+import pytest
+from app.core import pool, extractor
+from app.core.cache import result_cache
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _exit(_):
+    os._exit(1)
+
+
+def _normalize(text, eng_numbering):
+    if "hang" in text:
+        time.sleep(60)
+    return text
+
+
+@pytest.fixture
+def hanging_page(monkeypatch):
+    # Patched before the workers fork, so they see it too
+    monkeypatch.setattr(extractor, "normalize_digits_and_fix_order", _normalize)
+    monkeypatch.setattr(extractor, "plan_workers", lambda **_: 0)
+    monkeypatch.setattr(extractor, "PAGE_TIMEOUT_SECONDS", 0.5)
+    monkeypatch.setattr(result_cache, "enabled", False)
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(pool, "TASK_DIR", str(tmp_path))
+    monkeypatch.setattr(pool, "PAGE_TIMEOUT_SECONDS", 0.5)
+    monkeypatch.setattr(pool, "TASK_CHECK_SECONDS", 0.05)
+    pool.start_pool(2)
+    yield
+    pool.shutdown_pool()
+
+
+def test_timeout_only_fails_its_own_task(workers):
+    retried = pool._counters["tasks_retried"]
+    hung = pool.submit(_sleep, 30)
+    others = [pool.submit(_sleep, 0.1) for _ in range(4)]
+
+    with pytest.raises(pool.TaskTimeout):
+        hung.result(10)
+    assert [future.result(10)[1] for future in others] == [0.1] * 4
+    assert pool._counters["tasks_retried"] == retried
+
+
+def test_dead_worker_only_fails_its_own_task(workers):
+    lost = pool._counters["tasks_lost"]
+    dead = pool.submit(_exit, None)
+    other = pool.submit(_sleep, 0.1)
+
+    with pytest.raises(pool.TaskTimeout):
+        dead.result(10)
+    assert other.result(10)[1] == 0.1
+    assert pool._counters["tasks_lost"] == lost + 1
+    assert pool.submit(_sleep, 0).result(10)[1] == 0
+
+
+def test_cheap_document_still_times_out(hanging_page, workers):
+    with fitz.open() as doc:
+        for text in ("one", "hang", "three"):
+            doc.new_page().insert_text((72, 72), text)
+        data = doc.tobytes()
+
+    pages = extractor.MuExtractor(content=data).extract_text()
+
+    assert [page.get("timed_out", False) for page in pages] == [False, True, False]
+    assert pages[2]["text"] == "three\n"
@@ -0,0 +1,24 @@
+import pytest
+from app.core.utils import parse_page_ranges
+
+
+def test_open_range_past_the_end_selects_nothing():
+    assert parse_page_ranges("1-3,10,20-", 10) == [0, 1, 2, 9]
+    assert parse_page_ranges("20-", 10) == []
+
+
+def test_ranges_are_clipped_to_the_document():
+    assert parse_page_ranges("35", 10) == []
+    assert parse_page_ranges("2-100", 10) == list(range(1, 10))
+    assert parse_page_ranges("8-", 10) == [7, 8, 9]
+    assert parse_page_ranges("-2", 10) == [0, 1]
+
+
+def test_overlapping_ranges_are_merged():
+    assert parse_page_ranges("3-5, 4, 1-3,", 10) == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("spec", ["0", "0-3", "5-2", "a", "1-b", "1-2-3"])
+def test_invalid_ranges_are_rejected(spec):
+    with pytest.raises(ValueError):
+        parse_page_ranges(spec, 10)